@@ -1,11 +1,32 @@
+import hmac
 import os
 from datetime import date, datetime  # Added datetime import
-from flask import Flask, render_template, request, redirect, url_for, session, flash, abort, send_from_directory,jsonify
-import mysql.connector
-import hashlib
+from flask import Flask, render_template, request, redirect, url_for, session, flash, abort, send_from_directory, jsonify, Response, stream_with_context
 import config  # Your DB config here
-from functools import wraps
+import db
+import archives
+import blobstore
+import bulk_import
+import jobs
+import metrics
+import downloads
+import exports
+import gradebook
+import uploads
+import pagination
+import passwords
+import poll_tallies
+import poll_stream
+import quiz_analytics
+import quiz_store
+import search as search_index
+import sessions
+import user_search
+import users
+from counters import counters
+from functools import partial, wraps
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
@@ -27,27 +48,46 @@ if not os.path.exists(RESOURCE_FOLDER):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def get_db_connection():
-    return mysql.connector.connect(
-        host=config.DB_HOST,
-        user=config.DB_USER,
-        password=config.DB_PASSWORD,
-        database=config.DB_NAME
-    )
+db.init_app(app)
+metrics.init_app(app)
+sessions.init_app(app)
+uploads.init_app(app)
+downloads.init_app(app)
+jobs.init_app(app)
+
+@app.template_global()
+def blob_version(sha256):
+    return downloads.blob_version(sha256)
 
-def hash_password_sha1(password):
-    return hashlib.sha1(password.encode('utf-8')).hexdigest()
+def get_db_connection():
+    # pooled + bound to the current request, returned to the pool on teardown
+    return db.get_connection()
+
+@app.errorhandler(db.PoolExhausted)
+@app.errorhandler(passwords.HashingBusy)
+def pool_exhausted(e):
+    return "The server is busy, please try again in a moment.", 503, {'Retry-After': '5'}
+
+@app.errorhandler(RequestEntityTooLarge)
+def upload_too_large(e):
+    message = e.description if e.description else 'File too large.'
+    if request.args.get('format') == 'json':
+        return jsonify({'status': 'error', 'message': message}), 413
+    if request.url_rule is None or 'GET' not in request.url_rule.methods:
+        # POST-only endpoint: redirecting back would turn into a 405
+        return message, 413
+    flash(message, 'danger')
+    return redirect(request.url)
 
 def role_required(*roles):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if 'user_id' not in session:
-                print("User not logged in")
                 return redirect(url_for('login'))
             user_role = session.get('role')
-            print(f"User role: {user_role}, Allowed roles: {roles}")
             if user_role not in roles:
+                app.logger.info("user %s (role %s) denied %s", session['user_id'], user_role, request.endpoint)
                 abort(403)
             return f(*args, **kwargs)
         return decorated_function
@@ -60,30 +100,21 @@ def home():
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
-        name = request.form['name']
-        surname = request.form['surname']
-        username = request.form['username']
-        email = request.form['email']
-        birth_date = request.form['birth_date']  # YYYY-MM-DD
-        sexe = request.form['sexe']
         password = request.form['password']
         role = int(request.form['role'])  # 2=Teacher, 3=Student
 
-        hashed_pw = hash_password_sha1(password)
+        hashed_pw = passwords.hash_password(password)
         registration_date = date.today()
 
         conn = get_db_connection()
         cursor = conn.cursor()
         try:
-            cursor.execute('''
-                INSERT INTO Users 
-                (Name, Surname, Username, Email, Birth_date, Registration_date, Password, Role, Sexe)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            ''', (name, surname, username, email, birth_date, registration_date, hashed_pw, role, sexe))
+            users.insert_user(cursor, users.user_row(request.form, hashed_pw, role, registration_date))
             conn.commit()
+            counters.incr('users')
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
-        except mysql.connector.errors.IntegrityError as e:
+        except db.IntegrityError as e:
             flash(f'Error: {str(e)}', 'danger')
         finally:
             cursor.close()
@@ -96,22 +127,35 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        input_hash = hash_password_sha1(password)
 
         conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT ID, Password, Role FROM Users WHERE Username = %s", (username,))
         user = cursor.fetchone()
         cursor.close()
-        conn.close()
 
         if not user:
             flash("User not found.", "danger")
             return redirect(url_for('login'))
 
         user_id, stored_hash, role = user
-
-        if input_hash == stored_hash:
+        matches, needs_rehash = passwords.verify_password(stored_hash, password)
+
+        if matches:
+            if needs_rehash:
+                # upgrade SHA-1 / old-cost hashes while we have the password;
+                # if the pool is busy it can wait for the next login
+                try:
+                    new_hash = passwords.hash_password(password, timeout=0)
+                except passwords.HashingBusy:
+                    new_hash = None
+                if new_hash:
+                    cursor = conn.cursor()
+                    cursor.execute("UPDATE Users SET Password = %s WHERE ID = %s AND Password = %s",
+                                   (new_hash, user_id, stored_hash))
+                    conn.commit()
+                    cursor.close()
+            session.regenerate()
             session['user_id'] = user_id
             session['username'] = username
             session['role'] = int(role)
@@ -129,20 +173,13 @@ def dashboard():
     role = session.get('role')
 
     conn = get_db_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("SELECT COUNT(*) FROM Polls")
-    poll_count = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM Quizzes")
-    quiz_count = cursor.fetchone()[0]
+    poll_count = counters.get(conn, 'polls')
+    quiz_count = counters.get(conn, 'quizzes')
 
     if role == 1 or role == 2:
-        cursor.execute("SELECT COUNT(*) FROM Users")
-        user_count = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(*) FROM Assignment_Submissions")
-        assignment_submissions = cursor.fetchone()[0]
+        user_count = counters.get(conn, 'users')
+        assignment_submissions = counters.get(conn, 'assignment_submissions')
 
         return render_template(
             'dashboard.html',
@@ -154,12 +191,10 @@ def dashboard():
         )
 
     elif role == 3:
-        cursor.execute("SELECT COUNT(*) FROM Quiz_Attempts WHERE user_id = %s", (user_id,))
-        student_attempts = cursor.fetchone()[0]
+        student_attempts = counters.get(conn, 'student_attempts', user_id)
 
          # Get assignment submissions for student
-        cursor.execute("SELECT COUNT(*) FROM Assignment_Submissions WHERE student_id = %s", (user_id,))
-        student_assignments = cursor.fetchone()[0]
+        student_assignments = counters.get(conn, 'student_assignments', user_id)
 
         return render_template(
             'dashboard.html',
@@ -176,84 +211,64 @@ def dashboard():
 @app.route('/admin/dashboard')
 @role_required(1)
 def admin_dashboard():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT COUNT(*) FROM users")
-    user_count = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM quizzes")
-    quiz_count = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM forums")
-    forum_count = cursor.fetchone()[0]
+    counts = counters.get_many(get_db_connection(),
+                               ('users', 'quizzes', 'forums', 'assignments', 'polls'))
 
-    cursor.execute("SELECT COUNT(*) FROM assignments")
-    assignment_count = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM polls")
-    poll_count = cursor.fetchone()[0]
+    return render_template('admin_dashboard.html',
+                           user_count=counts['users'],
+                           quiz_count=counts['quizzes'],
+                           forum_count=counts['forums'],
+                           poll_count=counts['polls'],
+                           assignment_count=counts['assignments'],)
 
-    cursor.close()
-    conn.close()
+@app.route('/admin/db/pool')
+@role_required(1)
+def db_pool_stats():
+    return jsonify(db.pool.stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    if config.METRICS_TOKEN:
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {config.METRICS_TOKEN}'):
+            abort(403)
+    elif not config.METRICS_PUBLIC:
+        abort(403)
+    return metrics.export()
+
+@app.route('/admin/passwords/pool')
+@role_required(1)
+def password_pool_stats():
+    return jsonify(passwords.pool.stats())
 
-    return render_template('admin_dashboard.html',
-                           user_count=user_count,
-                           quiz_count=quiz_count,
-                           forum_count=forum_count,
-                           poll_count=poll_count,
-                           assignment_count=assignment_count,)
+def user_list_page(role):
+    # search/sort/paging args shared by the teacher and student admin pages
+    search = request.args.get('search', '')
+    sort = request.args.get('sort', 'name')
+    if sort not in user_search.SORT_COLUMNS:
+        sort = 'name'
+    descending = request.args.get('order') == 'desc'
+    users, next_cursor = user_search.search_users(
+        get_db_connection(), role, search, sort, descending,
+        request.args.get('cursor'), config.ADMIN_USERS_PAGE_SIZE)
+    return users, dict(search=search, sort=sort, descending=descending, next_cursor=next_cursor)
 
 @app.route('/admin/manage/teachers')
 @role_required(1)
 def admin_manage_teachers():
-    search = request.args.get('search', '')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    if search:
-        cursor.execute("""
-            SELECT ID, Name, Username, Email, Registration_date
-            FROM Users
-            WHERE Role = 2 AND (Name LIKE %s OR Username LIKE %s)
-        """, (f'%{search}%', f'%{search}%'))
-    else:
-        cursor.execute("SELECT ID, Name, Username, Email, Registration_date FROM Users WHERE Role = 2")
-
-    teachers = cursor.fetchall()
-    conn.close()
-    return render_template('admin_manage_teachers.html', teachers=teachers)
+    teachers, paging = user_list_page(2)
+    return render_template('admin_manage_teachers.html', teachers=teachers, **paging)
 
 
 @app.route('/admin/manage/students')
 @role_required(1)
 def admin_manage_students():
-    search = request.args.get('search', '')
-    conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    if search:
-        cursor.execute("""
-            SELECT ID, Name, Username, Email, Registration_date
-            FROM Users
-            WHERE Role = 3 AND (Name LIKE %s OR Username LIKE %s)
-        """, (f'%{search}%', f'%{search}%'))
-    else:
-        cursor.execute("""
-            SELECT ID, Name, Username, Email, Registration_date
-            FROM Users
-            WHERE Role = 3
-        """)
-
-    students = cursor.fetchall()
-    conn.close()
-    return render_template('admin_manage_students.html', students=students)
+    students, paging = user_list_page(3)
+    return render_template('admin_manage_students.html', students=students, **paging)
 
 
 @app.route('/admin/delete/<int:user_id>', methods=['POST'])
 @role_required(1)
 def delete_user(user_id):
-    print(f"Received request to delete user ID: {user_id}")
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -261,26 +276,26 @@ def delete_user(user_id):
         cursor.execute("SELECT Role FROM Users WHERE ID = %s", (user_id,))
         row = cursor.fetchone()
         if not row:
-            print("User not found.")
             return jsonify({'status': 'error', 'message': 'User not found.'}), 404
         role = row[0]
         if role != 3:
-            print(f"User role is {role}, not student. Cannot delete.")
             return jsonify({'status': 'error', 'message': 'User is not a student.'}), 403
         
         cursor.execute("DELETE FROM Users WHERE ID = %s", (user_id,))
         conn.commit()
         deleted_rows = cursor.rowcount
+        counters.incr('users', delta=-deleted_rows)
         cursor.close()
         conn.close()
-        print(f"Deleted rows count: {deleted_rows}")
+        sessions.revoke_user(user_id)
+        app.logger.info("admin %s deleted user %s", session['user_id'], user_id)
 
         if deleted_rows == 0:
             return jsonify({'status': 'error', 'message': 'Delete failed.'}), 500
 
         return jsonify({'status': 'success'}), 200
     except Exception as e:
-        print('Exception:', e)
+        app.logger.exception("deleting user %s failed", user_id)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
@@ -294,27 +309,85 @@ def teacher_forum():
     # teacher forum code
     return render_template('teacher_forum.html')
 
-@app.route('/forums')
-@role_required(1, 2, 3)
-def forums():
+def fetch_forum_page(cursor_token, limit=config.FORUM_PAGE_SIZE):
+    # keyset pagination on (Timestamp, id), newest first; only a preview of
+    # each post's content is sent, the rest comes from forum_post_content
+    after = pagination.decode_cursor(cursor_token, 2)
+    where = ""
+    params = [config.FORUM_PREVIEW_CHARS, config.FORUM_PREVIEW_CHARS]
+    if after:
+        where = "WHERE f.Timestamp < %s OR (f.Timestamp = %s AND f.id < %s)"
+        params += [after[0], after[0], after[1]]
+
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
-    cursor.execute("""
-    SELECT 
+    cursor.execute(f"""
+    SELECT
+        f.id AS id,
         f.Subject AS subject,
         f.Title AS title,
-        f.Content AS content,
+        SUBSTR(f.Content, 1, %s) AS content,
+        CHAR_LENGTH(f.Content) > %s AS truncated,
         f.Timestamp AS timestamp,
         u.Username AS username
     FROM Forums f
     JOIN Users u ON f.UserID = u.ID
-    ORDER BY f.Timestamp DESC
-""")
+    {where}
+    ORDER BY f.Timestamp DESC, f.id DESC
+    LIMIT %s
+""", params + [limit + 1])
+    rows = cursor.fetchall()
+    cursor.close()
+
+    for row in rows:
+        row['truncated'] = bool(row['truncated'])
+    return pagination.split_page(rows, limit, lambda r: (r['timestamp'], r['id']))
 
-    posts = cursor.fetchall()
+@app.route('/forums')
+@role_required(1, 2, 3)
+def forums():
+    posts, next_cursor = fetch_forum_page(request.args.get('cursor'))
+    return render_template('forums.html', posts=posts, next_cursor=next_cursor)
+
+@app.route('/forums/feed')
+@role_required(1, 2, 3)
+def forums_feed():
+    posts, next_cursor = fetch_forum_page(request.args.get('cursor'))
+    for post in posts:
+        post['timestamp'] = str(post['timestamp'])
+    return jsonify({'posts': posts, 'next_cursor': next_cursor})
+
+@app.route('/forums/<int:post_id>/content')
+@role_required(1, 2, 3)
+def forum_post_content(post_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT Content FROM Forums WHERE id = %s", (post_id,))
+    row = cursor.fetchone()
     cursor.close()
-    conn.close()
-    return render_template('forums.html', posts=posts)
+    if not row:
+        return jsonify({'status': 'error', 'message': 'Post not found.'}), 404
+    return jsonify({'id': post_id, 'content': row[0]})
+
+@app.route('/search')
+@role_required(1, 2, 3)
+def search():
+    q = request.args.get('q', '').strip()
+    scope = request.args.get('scope', 'all')
+    if scope != 'all' and scope not in search_index.SOURCES:
+        scope = 'all'
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    results, has_more = [], False
+    if q:
+        results, has_more = search_index.search(get_db_connection(), q, scope, page, config.SEARCH_PAGE_SIZE)
+
+    if request.args.get('format') == 'json':
+        for r in results:
+            r['created'] = str(r['created'])
+            r['score'] = float(r['score'])
+        return jsonify({'results': results, 'page': page, 'has_more': has_more})
+    return render_template('search.html', q=q, scope=scope, page=page, results=results, has_more=has_more)
 
 @app.route('/forums/new', methods=['GET', 'POST'])
 @role_required(1,2)
@@ -333,6 +406,7 @@ def new_forum_post():
         cursor.execute("INSERT INTO Forums (Subject, Title, Content, UserID) VALUES (%s, %s, %s, %s)",
                        (subject, title, content, user_id))
         conn.commit()
+        counters.incr('forums')
         cursor.close()
         conn.close()
 
@@ -357,6 +431,7 @@ def create_assignment():
             VALUES (%s, %s, %s, %s)
         ''', (title, description, due_date, course_id))
         conn.commit()
+        counters.incr('assignments')
         cursor.close()
         conn.close()
 
@@ -406,32 +481,39 @@ def submit_assignment(assignment_id):
             user_id = session['user_id']
             timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
             filename = f"{user_id}_{assignment_id}_{timestamp}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
 
             conn = get_db_connection()
             cursor = conn.cursor()
 
             cursor.execute('''
-                SELECT id FROM assignment_submissions
+                SELECT id, blob_sha256 FROM assignment_submissions
                 WHERE assignment_id=%s AND student_id=%s
             ''', (assignment_id, user_id))
             existing = cursor.fetchone()
 
             now = datetime.now()
+            sha256 = blobstore.add_ref(cursor, file)
 
+            gradebook.record_submission(cursor, user_id, assignment_id, now, new=not existing)
             if existing:
                 cursor.execute('''
                     UPDATE assignment_submissions
-                    SET file=%s, submitted_at=%s
+                    SET file=%s, blob_sha256=%s, submitted_at=%s
                     WHERE id=%s
-                ''', (filename, now, existing[0]))
+                ''', (filename, sha256, now, existing[0]))
+                # the previous file is freed once nothing else points at it
+                blobstore.release(cursor, existing[1])
+                conn.commit()
+                if existing[1] and existing[1] != sha256:
+                    jobs.enqueue('gc_blobs', delay=config.BLOB_GC_GRACE, unique=True)
             else:
                 cursor.execute('''
-                    INSERT INTO assignment_submissions (assignment_id, student_id, file, submitted_at)
-                    VALUES (%s, %s, %s, %s)
-                ''', (assignment_id, user_id, filename, now))
-            conn.commit()
+                    INSERT INTO assignment_submissions (assignment_id, student_id, file, blob_sha256, submitted_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                ''', (assignment_id, user_id, filename, sha256, now))
+                conn.commit()
+                counters.incr('assignment_submissions')
+                counters.incr('student_assignments', user_id)
             cursor.close()
             conn.close()
 
@@ -461,7 +543,7 @@ def view_submissions(assignment_id):
     conn = get_db_connection()
     cursor = conn.cursor(dictionary=True)
     cursor.execute('''
-        SELECT s.id, s.file, s.submitted_at, u.Username, u.Name, u.Surname
+        SELECT s.id, s.file, s.blob_sha256, s.submitted_at, u.Username, u.Name, u.Surname
         FROM assignment_submissions s
         JOIN Users u ON s.student_id = u.ID
         WHERE s.assignment_id = %s
@@ -481,9 +563,49 @@ def view_submissions(assignment_id):
 
     return render_template('view_submissions.html', submissions=submissions, assignment=assignment)
 
+@app.route('/assignments/<int:assignment_id>/submissions/export')
+@role_required(1,2)
+def export_submissions(assignment_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT 1 FROM assignments WHERE id=%s', (assignment_id,))
+    found = cursor.fetchone()
+    cursor.close()
+    if not found:
+        abort(404)
+    rv = exports.export_query(conn, 'submissions', assignment_id, request.args.get('format', 'csv'))
+    if rv is None:
+        abort(400)
+    return rv
+
+@app.route('/gradebook')
+@role_required(1, 2)
+def gradebook_view():
+    rows, next_cursor = gradebook.page(get_db_connection(), request.args.get('cursor'),
+                                       limit=config.GRADEBOOK_PAGE_SIZE)
+    if request.args.get('format') == 'json':
+        return jsonify({'rows': rows, 'next_cursor': next_cursor})
+    return render_template('gradebook.html', rows=rows, next_cursor=next_cursor)
+
+@app.route('/gradebook/export')
+@role_required(1, 2)
+def gradebook_export():
+    rv = exports.export_response(get_db_connection(), gradebook.EXPORT_SQL, (), gradebook.EXPORT_COLUMNS,
+                                 request.args.get('format', 'csv'), 'gradebook')
+    if rv is None:
+        abort(400)
+    return rv
+
 @app.route('/uploads/assignments/<filename>')
 def uploaded_file(filename):
-    # Added send_from_directory import to serve files
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT blob_sha256 FROM assignment_submissions WHERE file=%s LIMIT 1", (filename,))
+    row = cursor.fetchone()
+    cursor.close()
+    if row and row[0]:
+        return downloads.send_blob(row[0], filename)
+    # submitted before the blob store existed
     return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
 
 @app.route('/resources', methods=['GET', 'POST'])
@@ -497,13 +619,12 @@ def resources():
         file = request.files['file']
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['RESOURCE_FOLDER'], filename)
-            file.save(filepath)
+            sha256 = blobstore.add_ref(cursor, file)
 
             cursor.execute('''
-                INSERT INTO resources (filename, uploaded_by, description)
-                VALUES (%s, %s, %s)
-            ''', (filename, session['user_id'], description))
+                INSERT INTO resources (filename, uploaded_by, description, blob_sha256)
+                VALUES (%s, %s, %s, %s)
+            ''', (filename, session['user_id'], description, sha256))
             conn.commit()
             flash("Resource uploaded successfully!", "success")
         else:
@@ -523,6 +644,14 @@ def resources():
 
 @app.route('/uploads/resources/<filename>')
 def download_resource(filename):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT blob_sha256 FROM resources WHERE filename=%s ORDER BY id DESC LIMIT 1", (filename,))
+    row = cursor.fetchone()
+    cursor.close()
+    if row and row[0]:
+        return downloads.send_blob(row[0], filename, as_attachment=True)
+    # uploaded before the blob store existed
     return send_from_directory(app.config['RESOURCE_FOLDER'], filename, as_attachment=True)
 
 @app.route('/delete-resource', methods=['POST'])
@@ -540,48 +669,81 @@ def delete_resource():
     conn = get_db_connection()
     cur = conn.cursor()
 
-    # Optionally: check ownership or permissions here
-    cur.execute("DELETE FROM resources WHERE id = %s AND uploaded_by = %s", (resource_id,))
+    # Only the uploader can delete their resource
+    cur.execute("SELECT blob_sha256 FROM resources WHERE id = %s AND uploaded_by = %s", (resource_id, session['user_id']))
+    row = cur.fetchone()
+    if row:
+        cur.execute("DELETE FROM resources WHERE id = %s", (resource_id,))
+        blobstore.release(cur, row[0])
     conn.commit()
+    if row:
+        jobs.enqueue('gc_blobs', delay=config.BLOB_GC_GRACE, unique=True)
     cur.close()
     conn.close()
 
     flash("Resource deleted successfully.", "success")
     return redirect(url_for('resources'))
 
-@app.route('/polls')
-def polls():
-    user_id = session.get('user_id')
-    user_role = session.get('role')  # Assuming you store role in session on login
-    
+def fetch_polls_page(user_id, cursor_token, limit=config.POLLS_PAGE_SIZE):
+    # three queries whatever the page size: the page of polls (keyset on
+    # created_at, id), their options, and the user's votes on them
+    after = pagination.decode_cursor(cursor_token, 2)
+    where = ""
+    params = []
+    if after:
+        where = "WHERE created_at < %s OR (created_at = %s AND id < %s)"
+        params = [after[0], after[0], after[1]]
+
     conn = get_db_connection()
     cur = conn.cursor()
-
-    cur.execute("""
-        SELECT p.id, p.question, po.id AS option_id, po.option_text 
-        FROM polls p 
-        JOIN poll_options po ON p.id = po.poll_id
-        ORDER BY p.created_at DESC
-    """)
-    rows = cur.fetchall()
+    cur.execute(f"""
+        SELECT id, question, created_at
+        FROM polls
+        {where}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, params + [limit + 1])
+    rows, next_cursor = pagination.split_page(cur.fetchall(), limit, lambda r: (r[2], r[0]))
 
     polls = {}
-    for row in rows:
-        poll_id, question, option_id, option_text = row
-        if poll_id not in polls:
-            polls[poll_id] = {
-                "question": question,
-                "options": []
-            }
-        polls[poll_id]["options"].append({
-            "id": option_id,
-            "text": option_text
-        })
+    for poll_id, question, _ in rows:
+        polls[poll_id] = {"question": question, "options": [], "voted_option_id": None}
+
+    if polls:
+        ids = tuple(polls)
+        in_list = ','.join(['%s'] * len(ids))
+        cur.execute(f"""
+            SELECT poll_id, id, option_text
+            FROM poll_options
+            WHERE poll_id IN ({in_list})
+            ORDER BY id
+        """, ids)
+        for poll_id, option_id, option_text in cur.fetchall():
+            polls[poll_id]["options"].append({
+                "id": option_id,
+                "text": option_text
+            })
+
+        if user_id:
+            cur.execute(f"""
+                SELECT poll_id, option_id
+                FROM poll_votes
+                WHERE user_id = %s AND poll_id IN ({in_list})
+            """, (user_id,) + ids)
+            for poll_id, option_id in cur.fetchall():
+                polls[poll_id]["voted_option_id"] = option_id
 
     cur.close()
-    conn.close()
+    return polls, next_cursor
+
+@app.route('/polls')
+def polls():
+    user_id = session.get('user_id')
+    user_role = session.get('role')  # Assuming you store role in session on login
 
-    return render_template('polls.html', polls=polls, user_id=user_id, user_role=user_role)
+    polls, next_cursor = fetch_polls_page(user_id, request.args.get('cursor'))
+
+    return render_template('polls.html', polls=polls, user_id=user_id, user_role=user_role, next_cursor=next_cursor)
 
 
 @app.route('/polls/create', methods=['GET', 'POST'])
@@ -610,14 +772,13 @@ def create_poll():
         poll_id = cur.lastrowid
 
         # Insert options
-        for option_text in options:
-            cur.execute("""
-                INSERT INTO poll_options (poll_id, option_text) VALUES (%s, %s)
-            """, (poll_id, option_text.strip()))
+        db.insert_many(cur, 'poll_options', ('poll_id', 'option_text'),
+                       [(poll_id, option_text.strip()) for option_text in options])
 
         conn.commit()
         cur.close()
         conn.close()
+        counters.incr('polls')
 
         flash("Poll created successfully!", "success")
         return redirect(url_for('polls'))
@@ -645,6 +806,13 @@ def poll_vote():
         flash("Invalid vote submission.", "error")
         return redirect(url_for('polls'))
 
+    try:
+        poll_id = int(poll_id)
+        option_id = int(option_id)
+    except ValueError:
+        flash("Invalid vote submission.", "error")
+        return redirect(url_for('polls'))
+
     conn = get_db_connection()
     cur = conn.cursor()
 
@@ -658,14 +826,23 @@ def poll_vote():
         conn.close()
         return redirect(url_for('polls'))
 
-    # Insert vote
-    cur.execute("""
-      INSERT INTO poll_votes (poll_id, option_id, user_id) VALUES (%s, %s, %s)
-    """, (poll_id, option_id, user_id))
+    # Insert vote and bump the option's counter in one transaction
+    try:
+        recorded = poll_tallies.record_vote(cur, poll_id, option_id, user_id)
+    except db.IntegrityError:
+        # a second submit raced past the check above
+        conn.rollback()
+        flash("You have already voted on this poll.", "warning")
+        return redirect(url_for('polls'))
+    if not recorded:
+        conn.rollback()
+        flash("Invalid vote submission.", "error")
+        return redirect(url_for('polls'))
 
     conn.commit()
     cur.close()
     conn.close()
+    poll_tallies.results.add_vote(poll_id, option_id)
 
     flash("Thank you for voting!", "success")
     return redirect(url_for('poll_results', poll_id=poll_id))
@@ -673,35 +850,82 @@ def poll_vote():
 
 @app.route('/polls/results/<int:poll_id>')
 def poll_results(poll_id):
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Get poll question
-    cur.execute("SELECT question FROM polls WHERE id=%s", (poll_id,))
-    poll = cur.fetchone()
-    if not poll:
+    results = poll_tallies.results.get(get_db_connection(), poll_id)
+    if not results:
         flash("Poll not found.", "error")
-        cur.close()
-        conn.close()
         return redirect(url_for('polls'))
 
-    # Get poll options and vote counts
-    cur.execute("""
-        SELECT po.id, po.option_text, COUNT(pv.id) as votes
-        FROM poll_options po
-        LEFT JOIN poll_votes pv ON po.id = pv.option_id
-        WHERE po.poll_id = %s
-        GROUP BY po.id
-        ORDER BY po.id
-    """, (poll_id,))
-    options = cur.fetchall()
+    total_votes = results['total'] or 1  # avoid division by zero
 
-    cur.close()
-    conn.close()
+    return render_template('poll_results.html', poll=results['question'], options=results['options'],
+                           total_votes=total_votes, poll_id=poll_id)
+
+@app.route('/polls/results/<int:poll_id>/stream')
+def poll_results_stream(poll_id):
+    results = poll_tallies.results.get(get_db_connection(), poll_id)
+    if not results:
+        abort(404)
+    # the stream can stay open for a whole lecture, don't hold a pooled connection for it
+    db.release_connection()
+    return Response(stream_with_context(poll_stream.stream(poll_id, results)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/admin/polls/reconcile', methods=['POST'])
+@role_required(1)
+def reconcile_poll_tallies():
+    poll_id = request.form.get('poll_id', type=int)
+    job_id = jobs.enqueue('reconcile_polls', poll_id, owner_id=session['user_id'], unique=True)
+    return jsonify({'status': 'queued', 'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/admin/gradebook/rebuild', methods=['POST'])
+@role_required(1)
+def rebuild_gradebook():
+    job_id = jobs.enqueue('rebuild_gradebook', owner_id=session['user_id'], unique=True)
+    return jsonify({'status': 'queued', 'job_id': job_id, 'status_url': url_for('job_status', job_id=job_id)}), 202
+
+@app.route('/jobs/<int:job_id>')
+@role_required(1, 2, 3)
+def job_status(job_id):
+    job = jobs.status(job_id)
+    if not job or (session.get('role') != 1 and job['owner_id'] != session['user_id']):
+        return jsonify({'status': 'error', 'message': 'Job not found.'}), 404
+    return jsonify(job)
+
+@app.route('/admin/jobs')
+@role_required(1)
+def job_stats():
+    return jsonify(jobs.stats())
+
+@jobs.task('gc_blobs')
+def gc_blobs_job():
+    blobstore.gc(get_db_connection())
 
-    total_votes = sum(vote_count for _, _, vote_count in options) or 1  # avoid division by zero
+@jobs.task('reconcile_polls')
+def reconcile_polls_job(poll_id=None):
+    poll_tallies.reconcile(get_db_connection(), poll_id)
 
-    return render_template('poll_results.html', poll=poll[0], options=options, total_votes=total_votes)
+@jobs.task('rebuild_gradebook')
+def rebuild_gradebook_job():
+    gradebook.rebuild(get_db_connection())
+
+@app.cli.command('gc-blobs')
+def gc_blobs_command():
+    """Delete uploaded files that no submission or resource refers to anymore."""
+    removed = blobstore.gc(get_db_connection())
+    print(f"Removed {removed} unreferenced blobs.")
+
+@app.cli.command('reconcile-polls')
+def reconcile_polls_command():
+    """Recompute every poll option's vote_count from poll_votes."""
+    updated = poll_tallies.reconcile(get_db_connection())
+    print(f"Reconciled {updated} poll options.")
+
+@app.cli.command('rebuild-gradebook')
+def rebuild_gradebook_command():
+    """Recompute the gradebook table from quiz attempts and submissions."""
+    rows = gradebook.rebuild(get_db_connection())
+    print(f"Rebuilt {rows} gradebook rows.")
 
 
 
@@ -709,29 +933,20 @@ def poll_results(poll_id):
 @role_required(1) 
 def add_student():
     if request.method == 'POST':
-        name = request.form['name']
-        surname = request.form['surname']
-        username = request.form['username']
-        email = request.form['email']
         password = request.form['password']
-        sexe = request.form['sexe']
-        birth_date = request.form['birth_date']
         registration_date = datetime.now() 
 
-        hashed_pw = hashlib.sha1(password.encode()).hexdigest()
+        hashed_pw = passwords.hash_password(password)
 
         conn = get_db_connection()
         cursor = conn.cursor()
 
         try:
-            cursor.execute("""
-                INSERT INTO Users 
-                (Name, Surname, Username, Email, Password, Sexe, Birth_date, Registration_date, Role)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (name, surname, username, email, hashed_pw, sexe, birth_date, registration_date, 3))
+            users.insert_user(cursor, users.user_row(request.form, hashed_pw, 3, registration_date))
             conn.commit()
+            counters.incr('users')
             flash("✅ Student added successfully!", "success")
-        except mysql.connector.IntegrityError:
+        except db.IntegrityError:
             flash("❌ Username already exists. Please choose another.", "error")
         finally:
             cursor.close()
@@ -741,6 +956,27 @@ def add_student():
 
     return render_template('add_student.html')
 
+@app.route('/add_student/bulk', methods=['POST'])
+@role_required(1)
+def bulk_add_students():
+    file = request.files.get('file')
+    fmt = file.filename.rsplit('.', 1)[-1].lower() if file and '.' in file.filename else ''
+    wants_json = request.args.get('format') == 'json'
+    if fmt not in ('csv', 'jsonl'):
+        if wants_json:
+            return jsonify({'status': 'error', 'message': 'Upload a .csv or .jsonl file.'}), 400
+        flash("❌ Upload a .csv or .jsonl file.", "error")
+        return redirect(url_for('add_student'))
+
+    # no timeout: the import waits its turn behind logins instead of failing halfway
+    created, failed, errors = bulk_import.import_students(get_db_connection(), uploads.spool(file), fmt,
+                                                          partial(passwords.hash_password, timeout=None))
+    counters.incr('users', delta=created)
+    if wants_json:
+        return jsonify({'status': 'success', 'created': created, 'failed': failed, 'errors': errors})
+    flash(f"✅ Imported {created} students, {failed} rows rejected.", "success" if not failed else "error")
+    return render_template('add_student.html', import_errors=errors)
+
 
 
 @app.route('/quizzes')
@@ -774,13 +1010,13 @@ def add_question(quiz_id):
         question_id = cur.lastrowid
 
         # Insert options
-        for i, option_text in enumerate(options):
-            is_correct = (i == correct_option)
-            cur.execute("INSERT INTO quiz_options (question_id, option_text, is_correct) VALUES (%s, %s, %s)",
-                        (question_id, option_text, is_correct))
+        db.insert_many(cur, 'quiz_options', ('question_id', 'option_text', 'is_correct'),
+                       [(question_id, option_text, i == correct_option) for i, option_text in enumerate(options)])
         conn.commit()
         cur.close()
         conn.close()
+        quiz_store.invalidate(quiz_id)
+        quiz_analytics.invalidate(quiz_id)
         flash("Question added successfully.", "success")
         return redirect(url_for('add_question', quiz_id=quiz_id))
     return render_template('add_question.html', quiz_id=quiz_id)
@@ -793,37 +1029,12 @@ def take_quiz(quiz_id):
         flash("Only students can take quizzes.", "error")
         return redirect(url_for('quizzes'))
 
-    conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Get quiz
-    cur.execute("SELECT id, title, description FROM quizzes WHERE id=%s", (quiz_id,))
-    quiz = cur.fetchone()
+    quiz = quiz_store.get_quiz(get_db_connection(), quiz_id)
     if not quiz:
         flash("Quiz not found.", "error")
-        cur.close()
-        conn.close()
         return redirect(url_for('quizzes'))
 
-    # Get questions and options
-    cur.execute("SELECT id, question_text FROM quiz_questions WHERE quiz_id=%s", (quiz_id,))
-    questions_data = cur.fetchall()
-
-    questions = []
-    for q in questions_data:
-        q_id, q_text = q
-        cur.execute("SELECT id, option_text FROM quiz_options WHERE question_id=%s", (q_id,))
-        options = cur.fetchall()
-        questions.append({
-            'id': q_id,
-            'text': q_text,
-            'options': [{'id': o[0], 'text': o[1]} for o in options]
-        })
-
-    cur.close()
-    conn.close()
-
-    return render_template('take_quiz.html', quiz={'id': quiz[0], 'title': quiz[1], 'description': quiz[2]}, questions=questions)
+    return render_template('take_quiz.html', quiz=quiz, questions=quiz['questions'])
 
 @app.context_processor
 def inject_user():
@@ -855,21 +1066,12 @@ def submit_quiz(quiz_id):
             continue
 
     conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Fetch correct answers
-    cur.execute("""
-        SELECT qq.id, qo.id, qo.is_correct
-        FROM quiz_questions qq
-        JOIN quiz_options qo ON qq.id = qo.question_id
-        WHERE qq.quiz_id=%s
-    """, (quiz_id,))
-    rows = cur.fetchall()
 
-    correct_answers = {}
-    for q_id, option_id, is_correct in rows:
-        if is_correct:
-            correct_answers[q_id] = option_id
+    quiz = quiz_store.get_quiz(conn, quiz_id)
+    if not quiz:
+        flash("Quiz not found.", "error")
+        return redirect(url_for('quizzes'))
+    correct_answers = quiz['answer_key']
 
     score = 0
     total_questions = len(correct_answers)
@@ -878,19 +1080,20 @@ def submit_quiz(quiz_id):
         if correct_answers.get(q_id) == selected_option_id:
             score += 1
 
-    # Save attempt
-    # After score calculation...
+    cur = conn.cursor()
 
 # Insert attempt
-    cur.execute("""INSERT INTO quiz_attempts (quiz_id, user_id, score, taken_at) VALUES (%s, %s, %s, NOW())""", (quiz_id, user_id, score))
-    conn.commit()  # commit so lastrowid works
-
-    attempt_id = cur.lastrowid
-
-# Insert answers for the attempt
-    for q_id, selected_option_id in answers_dict.items():
-        cur.execute("""INSERT INTO quiz_answers (attempt_id, question_id, selected_option_id) VALUES (%s, %s, %s) """, (attempt_id, q_id, selected_option_id))
+    taken_at = datetime.now().replace(microsecond=0)
+    gradebook.record_attempt(cur, user_id, quiz_id, score, total_questions, taken_at)
+    cur.execute("""INSERT INTO quiz_attempts (quiz_id, user_id, score, taken_at) VALUES (%s, %s, %s, %s)""", (quiz_id, user_id, score, taken_at))
+    attempt_id = cur.lastrowid  # available before commit
+
+# Insert answers for the attempt, same transaction
+    db.insert_many(cur, 'quiz_answers', ('attempt_id', 'question_id', 'selected_option_id'),
+                   [(attempt_id, q_id, selected_option_id) for q_id, selected_option_id in answers_dict.items()])
     conn.commit()
+    counters.incr('student_attempts', user_id)
+    quiz_analytics.invalidate(quiz_id)
 
     cur.close()
     conn.close()
@@ -923,30 +1126,6 @@ def quiz_results(attempt_id):
         flash("Unauthorized access to results.", "error")
         return redirect(url_for('quizzes'))
 
-    # Get all questions and options
-    cur.execute("""
-        SELECT q.id, q.question_text, o.id, o.option_text, o.is_correct
-        FROM quiz_questions q
-        JOIN quiz_options o ON q.id = o.question_id
-        WHERE q.quiz_id = %s
-        ORDER BY q.id, o.id
-    """, (quiz_id,))
-    rows = cur.fetchall()
-
-    questions_dict = {}
-    for q_id, q_text, o_id, o_text, is_correct in rows:
-        if q_id not in questions_dict:
-            questions_dict[q_id] = {
-                'id': q_id,
-                'text': q_text,
-                'options': []
-            }
-        questions_dict[q_id]['options'].append({
-            'id': o_id,
-            'text': o_text,
-            'is_correct': is_correct
-        })
-
     # Fetch user's selected answers
     cur.execute("""
         SELECT question_id, selected_option_id
@@ -957,15 +1136,15 @@ def quiz_results(attempt_id):
     user_answers = {q_id: selected_id for q_id, selected_id in answer_rows}
 
     cur.close()
-    conn.close()
 
-    total_questions = len(questions_dict)
+    quiz = quiz_store.get_quiz(conn, quiz_id)
+    questions = quiz['questions'] if quiz else []
 
     return render_template(
         'quiz_results.html',
         score=score,
-        total_questions=total_questions,
-        questions=questions_dict.values(),  # convert dict to list
+        total_questions=len(questions),
+        questions=questions,
         user_answers=user_answers
     )
 
@@ -977,20 +1156,21 @@ def view_quiz_results(quiz_id):
         return redirect(url_for('quizzes'))
 
     conn = get_db_connection()
-    cur = conn.cursor()
-
-    # Fetch quiz title
-    cur.execute("SELECT title FROM quizzes WHERE id=%s", (quiz_id,))
-    quiz = cur.fetchone()
+    quiz = quiz_store.get_quiz(conn, quiz_id)
     if not quiz:
         flash("Quiz not found.", "error")
         return redirect(url_for('quizzes'))
 
+    analytics = quiz_analytics.get_analytics(conn, quiz)
+    if request.args.get('format') == 'json':
+        return jsonify(analytics)
+
     # Fetch student scores and attempt ids
+    cur = conn.cursor()
     cur.execute("""
-        SELECT u.username, qa.score, qa.id
+        SELECT u.Username, qa.score, qa.id
         FROM quiz_attempts qa
-        JOIN users u ON qa.user_id = u.id
+        JOIN Users u ON qa.user_id = u.ID
         WHERE qa.quiz_id = %s
     """, (quiz_id,))
     results = cur.fetchall()
@@ -998,44 +1178,50 @@ def view_quiz_results(quiz_id):
     cur.close()
     conn.close()
 
-    return render_template('view_quiz_results.html', quiz_title=quiz[0], results=results)
+    return render_template('view_quiz_results.html', quiz_title=quiz['title'], results=results,
+                           analytics=analytics, quiz_id=quiz_id)
 
-@app.route('/quiz/view/<int:quiz_id>')
-@role_required(1, 2)
-def view_quiz(quiz_id):
+@app.route('/assignments/<int:assignment_id>/submissions/download')
+@role_required(1,2)
+def download_submissions(assignment_id):
+    # ?latest=1: only each student's most recent submission
     conn = get_db_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    # Get quiz info
-    cursor.execute("SELECT * FROM quizzes WHERE id = %s", (quiz_id,))
-    quiz = cursor.fetchone()
-
-    # Get questions
-    cursor.execute("SELECT * FROM quiz_questions WHERE quiz_id = %s", (quiz_id,))
-    questions_raw = cursor.fetchall()
-
-    # Get all options in one go
-    question_ids = [q['id'] for q in questions_raw]
-    if question_ids:
-        format_strings = ','.join(['%s'] * len(question_ids))
-        cursor.execute(f"SELECT * FROM quiz_options WHERE question_id IN ({format_strings})", tuple(question_ids))
-        all_options = cursor.fetchall()
-    else:
-        all_options = []
+    cursor = conn.cursor()
+    cursor.execute('SELECT due_date FROM assignments WHERE id=%s', (assignment_id,))
+    assignment = cursor.fetchone()
+    cursor.close()
+    if not assignment:
+        abort(404)
 
-    # Organize options by question_id
-    options_by_qid = {}
-    for opt in all_options:
-        options_by_qid.setdefault(opt['question_id'], []).append(opt)
+    latest_only = request.args.get('latest') == '1'
+    rows = archives.submission_rows(conn, assignment_id, latest_only)
+    closed = assignment[0] is not None and assignment[0] < date.today()
+    return archives.zip_response(assignment_id, rows, app.config['UPLOAD_FOLDER'], latest_only, closed)
 
-    # Attach options to questions
-    for q in questions_raw:
-        q['options'] = options_by_qid.get(q['id'], [])
+@app.route('/quizzes/<int:quiz_id>/results/export')
+@role_required(2)
+def export_quiz_results(quiz_id):
+    # rows=attempts: one row per attempt; rows=answers: one per answer given
+    conn = get_db_connection()
+    rows = request.args.get('rows', 'attempts')
+    if rows not in ('attempts', 'answers'):
+        abort(400)
+    if not quiz_store.get_quiz(conn, quiz_id):
+        abort(404)
+    rv = exports.export_query(conn, 'quiz_' + rows, quiz_id, request.args.get('format', 'csv'))
+    if rv is None:
+        abort(400)
+    return rv
 
-    cursor.close()
-    conn.close()
+@app.route('/quiz/view/<int:quiz_id>')
+@role_required(1, 2)
+def view_quiz(quiz_id):
+    quiz = quiz_store.get_quiz(get_db_connection(), quiz_id)
+    if not quiz:
+        flash("Quiz not found.", "error")
+        return redirect(url_for('quizzes'))
 
-    return render_template("view_quiz.html", quiz=quiz, questions=questions_raw)
+    return render_template("view_quiz.html", quiz=quiz, questions=quiz['questions'])
 
 
 
@@ -1052,6 +1238,8 @@ def create_quiz():
         cur = conn.cursor()
         cur.execute("INSERT INTO quizzes (title, description) VALUES (%s, %s)", (title, description))
         conn.commit()
+        quiz_store.invalidate(cur.lastrowid)
+        counters.incr('quizzes')
         cur.close()
         conn.close()
         flash("Quiz created successfully.", "success")
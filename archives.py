@@ -0,0 +1,125 @@
+import glob
+import hashlib
+import os
+import tempfile
+import zipfile
+
+from flask import Response, send_file
+from werkzeug.utils import secure_filename
+
+import blobstore
+import config
+from exports import ChunkSink
+
+# ZIP downloads of an assignment's submissions. The archive is written
+# straight into the response: each file is read ARCHIVE_CHUNK_SIZE bytes at
+# a time and the compressed bytes are sent as they come out of zipfile,
+# which writes data descriptors instead of seeking back, so neither the
+# archive nor a whole file is ever held in memory or spooled to disk.
+#
+# Once an assignment is past its due date its archive is also written to
+# ARCHIVE_FOLDER while it streams, and served from there afterwards. The
+# cached file is named after a hash of the submissions it contains, so a
+# late submission makes the next download build a new one.
+
+# formats that are already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {'.pdf', '.zip', '.docx', '.xlsx', '.pptx', '.jpg', '.jpeg', '.png', '.gif',
+                     '.mp3', '.mp4', '.gz', '.7z', '.rar'}
+
+
+def submission_rows(conn, assignment_id, latest_only=False):
+    # (student_id, username, file, blob_sha256, submitted_at), newest first per student
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT s.student_id, u.Username, s.file, s.blob_sha256, s.submitted_at
+        FROM assignment_submissions s
+        LEFT JOIN Users u ON s.student_id = u.ID
+        WHERE s.assignment_id = %s
+        ORDER BY s.student_id, s.submitted_at DESC, s.id DESC
+    """, (assignment_id,))
+    rows = []
+    for row in cur:
+        if latest_only and rows and rows[-1][0] == row[0]:
+            continue
+        rows.append(row)
+    cur.close()
+    return rows
+
+
+def fingerprint(rows):
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(repr(row).encode())
+    return digest.hexdigest()[:16]
+
+
+def zip_chunks(rows, upload_folder):
+    """Bytes of a ZIP with one folder per student, as a generator."""
+    sink = ChunkSink()
+    missing = []
+    with zipfile.ZipFile(sink, 'w') as zf:
+        for student_id, username, filename, sha256, submitted_at in rows:
+            name = f"{secure_filename(username or '') or student_id}/{filename}"
+            path = blobstore.blob_path(sha256) if sha256 else os.path.join(upload_folder, filename)
+            try:
+                src = open(path, 'rb')
+            except OSError:
+                missing.append(name)
+                continue
+            with src:
+                info = zipfile.ZipInfo(name, submitted_at.timetuple()[:6] if submitted_at else (1980, 1, 1, 0, 0, 0))
+                stored = os.path.splitext(filename)[1].lower() in STORED_EXTENSIONS
+                info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                info.file_size = os.fstat(src.fileno()).st_size  # lets zipfile decide on ZIP64 up front
+                with zf.open(info, 'w') as dst:
+                    while True:
+                        block = src.read(config.ARCHIVE_CHUNK_SIZE)
+                        if not block:
+                            break
+                        dst.write(block)
+                        data = sink.take()
+                        if data:
+                            yield data
+            yield sink.take()  # the entry's header/descriptor
+        if missing:
+            zf.writestr('MISSING.txt', ''.join(f"{name}\n" for name in missing))
+    yield sink.take()
+
+
+def _tee_to_file(chunks, path):
+    # the file only appears under its name once the archive is complete
+    fd, partial = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        os.replace(partial, path)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    prefix = path.rsplit('_', 1)[0]
+    for old in glob.glob(glob.escape(prefix) + '_*.zip'):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass  # another worker got there first
+
+
+def zip_response(assignment_id, rows, upload_folder, latest_only=False, closed=False):
+    kind = 'latest' if latest_only else 'all'
+    download_name = f"assignment_{assignment_id}_{kind}.zip"
+    chunks = zip_chunks(rows, upload_folder)
+    if closed:
+        version = fingerprint(rows)
+        path = os.path.join(config.ARCHIVE_FOLDER, f"assignment_{assignment_id}_{kind}_{version}.zip")
+        if os.path.exists(path):
+            return send_file(os.path.abspath(path), mimetype='application/zip', as_attachment=True,
+                             download_name=download_name, etag=version)
+        os.makedirs(config.ARCHIVE_FOLDER, exist_ok=True)
+        chunks = _tee_to_file(chunks, path)
+    # rows are already read, so the stream holds no DB connection
+    rv = Response(chunks, mimetype='application/zip')
+    rv.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return rv
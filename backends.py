@@ -0,0 +1,195 @@
+import sqlite3
+from datetime import date, datetime
+
+import mysql.connector
+
+import config
+
+# Database engines behind db.py. The app's SQL is written for MySQL with %s
+# placeholders; the SQLite engine (local runs, benchmarks, tests) accepts
+# the same statements by translating placeholders and registering the few
+# MySQL functions the queries use. Anything that can't be shared - DDL,
+# upserts, row locks, full-text search, schema introspection - is a method
+# here, so per-engine differences live in one place.
+
+
+class MySQLBackend:
+    name = 'mysql'
+    Error = mysql.connector.Error
+    IntegrityError = mysql.connector.IntegrityError
+    # substituted into schema.TABLES
+    ddl = {'id': 'INT AUTO_INCREMENT PRIMARY KEY', 'now': 'CURRENT_TIMESTAMP'}
+    like_escape = ''  # backslash is already the LIKE escape character
+
+    def connect(self):
+        return mysql.connector.connect(host=config.DB_HOST, user=config.DB_USER,
+                                       password=config.DB_PASSWORD, database=config.DB_NAME)
+
+    def ping(self, conn):
+        conn.ping(reconnect=False)
+
+    def upsert(self, table, columns, key, update):
+        # INSERT, or apply `update` to the row already holding that key
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON DUPLICATE KEY UPDATE {update}")
+
+    def for_update(self, cur):
+        # suffix for a locking read inside the current transaction
+        return ' FOR UPDATE'
+
+    def text_match(self, columns, words):
+        # (condition, score expression, condition params, score params); all words required, as prefixes
+        query = ' '.join(f'+{w}*' for w in words)
+        match = f"MATCH({', '.join(columns)}) AGAINST (%s IN BOOLEAN MODE)"
+        return match, match, [query], [query]
+
+    # schema introspection for schema.migrate()
+    def has_table(self, cur, table):
+        cur.execute('''
+            SELECT 1 FROM information_schema.tables
+            WHERE table_schema = DATABASE() AND LOWER(table_name) = LOWER(%s)
+        ''', (table,))
+        return cur.fetchone() is not None
+
+    def has_column(self, cur, table, column):
+        cur.execute('''
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND LOWER(table_name) = LOWER(%s) AND column_name = %s
+            LIMIT 1
+        ''', (table, column))
+        return cur.fetchone() is not None
+
+    def widen_sql(self, cur, table, column, length):
+        # ALTER statement if the VARCHAR column is shorter than length, else None
+        cur.execute('''
+            SELECT character_maximum_length, is_nullable FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND LOWER(table_name) = LOWER(%s) AND column_name = %s
+        ''', (table, column))
+        row = cur.fetchone()
+        if row is None or row[0] is None or row[0] >= length:
+            return None
+        null = '' if row[1] == 'YES' else ' NOT NULL'
+        return f"ALTER TABLE {table} MODIFY COLUMN {column} VARCHAR({length}){null}"
+
+    def has_index(self, cur, table, name):
+        cur.execute('''
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND LOWER(table_name) = LOWER(%s) AND index_name = %s
+            LIMIT 1
+        ''', (table, name))
+        return cur.fetchone() is not None
+
+    def create_index_sql(self, table, name, definition, kind):
+        return f"CREATE {kind} INDEX {name} ON {table} {definition}"
+
+
+def _dict_row(cursor, row):
+    return {col[0]: value for col, value in zip(cursor.description, row)}
+
+
+class SQLiteCursor:
+    # mysql.connector-style cursor over sqlite3: %s placeholders, dictionary rows
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        if dictionary:
+            cursor.row_factory = _dict_row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, params=()):
+        return self._cursor.execute(operation.replace('%s', '?'), tuple(params or ()))
+
+    def executemany(self, operation, seq_params):
+        return self._cursor.executemany(operation.replace('%s', '?'), seq_params)
+
+
+class SQLiteConnection:
+    def __init__(self, raw):
+        self._raw = raw
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, dictionary=False):
+        return SQLiteCursor(self._raw.cursor(), dictionary)
+
+
+class SQLiteBackend:
+    name = 'sqlite'
+    Error = sqlite3.Error
+    IntegrityError = sqlite3.IntegrityError
+    ddl = {'id': 'INTEGER PRIMARY KEY AUTOINCREMENT', 'now': "(datetime('now', 'localtime'))"}
+    like_escape = " ESCAPE '\\'"
+
+    def __init__(self):
+        # DATETIME/DATE columns come back as datetime/date, like from MySQL
+        sqlite3.register_adapter(datetime, lambda d: d.isoformat(' '))
+        sqlite3.register_adapter(date, lambda d: d.isoformat())
+        for decltype in ('DATETIME', 'TIMESTAMP'):
+            sqlite3.register_converter(decltype, lambda b: datetime.fromisoformat(b.decode()))
+        sqlite3.register_converter('DATE', lambda b: date.fromisoformat(b.decode()[:10]))
+
+    def connect(self):
+        # connections move between request threads through the pool, never concurrently
+        raw = sqlite3.connect(config.SQLITE_PATH, timeout=config.SQLITE_BUSY_TIMEOUT,
+                              detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        raw.execute("PRAGMA journal_mode=WAL")
+        raw.execute("PRAGMA synchronous=NORMAL")
+        raw.create_function('NOW', 0, lambda: datetime.now().isoformat(' ', 'seconds'))
+        raw.create_function('CHAR_LENGTH', 1, lambda s: None if s is None else len(s), deterministic=True)
+        return SQLiteConnection(raw)
+
+    def ping(self, conn):
+        conn.execute("SELECT 1")
+
+    def upsert(self, table, columns, key, update):
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT ({key}) DO UPDATE SET {update}")
+
+    def for_update(self, cur):
+        # no row locks: take the database write lock for the rest of the transaction
+        if not cur.connection.in_transaction:
+            cur.execute("BEGIN IMMEDIATE")
+        return ''
+
+    def text_match(self, columns, words):
+        # no full-text index: every word has to appear in one of the columns
+        condition = ' AND '.join(
+            '(' + ' OR '.join(f"{c} LIKE %s{self.like_escape}" for c in columns) + ')' for _ in words)
+        params = [f'%{escape_like(w)}%' for w in words for _ in columns]
+        return condition, '0', params, []
+
+    def has_table(self, cur, table):
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND LOWER(name) = LOWER(%s)", (table,))
+        return cur.fetchone() is not None
+
+    def has_column(self, cur, table, column):
+        cur.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cur.fetchall())
+
+    def widen_sql(self, cur, table, column, length):
+        return None  # SQLite doesn't enforce VARCHAR lengths
+
+    def has_index(self, cur, table, name):
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = %s", (name,))
+        return cur.fetchone() is not None
+
+    def create_index_sql(self, table, name, definition, kind):
+        if kind == 'FULLTEXT':
+            return None  # text_match() scans instead
+        return f"CREATE {kind} INDEX {name} ON {table} {definition}"
+
+
+def escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+BACKENDS = {'mysql': MySQLBackend, 'sqlite': SQLiteBackend}
+
+
+def get(name):
+    return BACKENDS[name]()
@@ -0,0 +1,296 @@
+"""Load test for the hot routes.
+
+Seeds a scratch database (MySQL, or an SQLite file with --backend sqlite)
+with synthetic users, quizzes, polls and
+forum posts, then drives login, take_quiz, submit_quiz, poll_vote, forums
+and dashboard through the Flask test client and reports throughput,
+latency percentiles and SQL statements per request (from metrics.py).
+
+    docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=... mysql:8
+    python bench.py --reset --students 2000 --requests 500 --concurrency 8 --save base.json
+    python bench.py --reset --students 2000 --requests 500 --concurrency 8 --compare base.json
+    python bench.py --backend sqlite --reset
+
+With --compare the run exits with status 1 when a scenario's p95 latency
+or queries per request got worse by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import mysql.connector
+
+import config
+
+BENCH_PASSWORD = 'bench-password'
+
+WORDS = ('exam lecture quiz chapter homework answer question teacher student grade '
+         'algebra physics history biology essay project deadline revision notes').split()
+
+
+def words(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def create_database(args):
+    # the tables themselves are created by schema.migrate when the app is imported
+    if args.backend == 'sqlite':
+        if args.reset and os.path.exists(args.sqlite_path):
+            os.remove(args.sqlite_path)
+        return
+    conn = mysql.connector.connect(host=config.DB_HOST, user=config.DB_USER, password=config.DB_PASSWORD)
+    cur = conn.cursor()
+    if args.reset:
+        cur.execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+    cur.execute(f"CREATE DATABASE IF NOT EXISTS `{args.database}`")
+    cur.close()
+    conn.close()
+
+
+def seed(args, rng):
+    # runs after the app import so the pool and ensure_schema's columns exist
+    import db
+    import passwords
+
+    conn = db.get_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM Users")
+    if cur.fetchone()[0]:
+        print("database already seeded, use --reset to start over")
+    else:
+        hashed = passwords.hash_password(BENCH_PASSWORD)
+        today = datetime.now()
+        people = [('teacher', 2, args.teachers), ('student', 3, args.students)]
+        db.insert_many(cur, 'Users', ('Name', 'Surname', 'Username', 'Email', 'Birth_date',
+                                      'Registration_date', 'Password', 'Role', 'Sexe'),
+                       [(words(rng, 1).title(), words(rng, 1).title(), f'{prefix}{i}', f'{prefix}{i}@bench.test',
+                         date(2000, 1, 1) + timedelta(days=rng.randrange(3000)), today, hashed, role,
+                         rng.choice(('Male', 'Female', 'Other')))
+                        for prefix, role, count in people for i in range(count)])
+        conn.commit()
+        cur.execute("SELECT ID FROM Users")
+        user_ids = [r[0] for r in cur.fetchall()]
+
+        for q in range(args.quizzes):
+            cur.execute("INSERT INTO quizzes (title, description) VALUES (%s, %s)",
+                        (f'Quiz {q}: {words(rng, 3)}', words(rng, 12)))
+            quiz_id = cur.lastrowid
+            db.insert_many(cur, 'quiz_questions', ('quiz_id', 'question_text'),
+                           [(quiz_id, words(rng, 10) + '?') for _ in range(args.questions)])
+            cur.execute("SELECT id FROM quiz_questions WHERE quiz_id = %s", (quiz_id,))
+            db.insert_many(cur, 'quiz_options', ('question_id', 'option_text', 'is_correct'),
+                           [(question_id, words(rng, 3), i == 0)
+                            for (question_id,) in cur.fetchall() for i in range(args.options)])
+            conn.commit()
+
+        start = datetime.now() - timedelta(days=30)
+        for p in range(args.polls):
+            cur.execute("INSERT INTO polls (question, created_by, created_at) VALUES (%s, %s, %s)",
+                        (f'Poll {p}: {words(rng, 6)}?', rng.choice(user_ids), start + timedelta(minutes=p)))
+            db.insert_many(cur, 'poll_options', ('poll_id', 'option_text'),
+                           [(cur.lastrowid, words(rng, 2)) for _ in range(args.options)])
+        conn.commit()
+
+        db.insert_many(cur, 'Forums', ('Subject', 'Title', 'Content', 'UserID', 'Timestamp'),
+                       [(words(rng, 2), words(rng, 6), words(rng, rng.randrange(20, 400)), rng.choice(user_ids),
+                         start + timedelta(seconds=30 * i)) for i in range(args.posts)])
+        conn.commit()
+
+    cur.execute("SELECT ID, Username FROM Users WHERE Role = 3 ORDER BY ID")
+    students = cur.fetchall()
+    cur.execute("SELECT id FROM quizzes ORDER BY id")
+    quizzes = [r[0] for r in cur.fetchall()]
+    cur.execute("SELECT poll_id, MIN(id) FROM poll_options GROUP BY poll_id ORDER BY poll_id")
+    polls = cur.fetchall()
+    cur.close()
+    conn.close()
+    return students, quizzes, polls
+
+
+class Scenarios:
+    def __init__(self, app, students, quizzes, polls):
+        import db
+        import quiz_store
+        self.app = app
+        self.db = db
+        self.quiz_store = quiz_store
+        self.students = students
+        self.quizzes = quizzes
+        self.polls = polls
+        self.votes = iter([(s, p) for p in polls for s in students])
+        self.lock = threading.Lock()
+
+    def client(self, student=None):
+        client = self.app.test_client()
+        if student:
+            with client.session_transaction() as s:
+                s['user_id'], s['username'], s['role'] = student[0], student[1], 3
+        return client
+
+    def login(self, i):
+        student = self.students[i % len(self.students)]
+        rv = self.client().post('/login', data={'username': student[1], 'password': BENCH_PASSWORD})
+        return rv.status_code == 302 and rv.location.endswith('/dashboard')
+
+    def take_quiz(self, i):
+        rv = self.client(self.students[i % len(self.students)]).get(f'/quizzes/{self.quizzes[i % len(self.quizzes)]}/take')
+        return rv.status_code == 200
+
+    def submit_quiz(self, i):
+        quiz_id = self.quizzes[i % len(self.quizzes)]
+        with self.app.app_context():
+            quiz = self.quiz_store.get_quiz(self.db.get_connection(), quiz_id)
+        answers = {str(q['id']): str(random.choice(q['options'])['id']) for q in quiz['questions'] if q['options']}
+        rv = self.client(self.students[i % len(self.students)]).post(f'/quizzes/{quiz_id}/submit', data=answers)
+        return rv.status_code == 302 and '/quiz/results/' in rv.location
+
+    def poll_vote(self, i):
+        # every vote is a (student, poll) pair that hasn't voted yet
+        with self.lock:
+            pair = next(self.votes, None)
+        if pair is None:
+            raise RuntimeError("ran out of unvoted (student, poll) pairs; seed more polls or students")
+        student, (poll_id, option_id) = pair
+        rv = self.client(student).post('/polls/vote', data={'poll_id': poll_id, 'option_id': option_id})
+        return rv.status_code == 302
+
+    def forums(self, i):
+        return self.client(self.students[i % len(self.students)]).get('/forums').status_code == 200
+
+    def dashboard(self, i):
+        return self.client(self.students[i % len(self.students)]).get('/dashboard').status_code == 200
+
+
+NAMES = ('login', 'take_quiz', 'submit_quiz', 'poll_vote', 'forums', 'dashboard')
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def histogram_sum(name, endpoint):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name + '_sum', {'endpoint': endpoint}) or 0.0
+
+
+def run(scenarios, name, requests, concurrency):
+    fn = getattr(scenarios, name)
+    latencies = [None] * requests
+    failures = 0
+
+    def one(i):
+        started = time.perf_counter()
+        ok = fn(i)
+        latencies[i] = time.perf_counter() - started
+        return ok
+
+    queries_before = histogram_sum('db_queries_per_request', name)
+    db_time_before = histogram_sum('db_time_per_request_seconds', name)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for ok in pool.map(one, range(requests)):
+            failures += not ok
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'failures': failures,
+        'throughput': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round((histogram_sum('db_queries_per_request', name) - queries_before) / requests, 2),
+        'db_ms_per_request': round((histogram_sum('db_time_per_request_seconds', name) - db_time_before)
+                                   / requests * 1000, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {now['p95_ms']} ms")
+        if now['queries_per_request'] > before['queries_per_request'] + 0.5:
+            regressions.append(f"{name}: queries/request {before['queries_per_request']} -> "
+                               f"{now['queries_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--backend', choices=('mysql', 'sqlite'), default=config.DB_BACKEND)
+    parser.add_argument('--database', default='teachme_bench', help="MySQL database to seed")
+    parser.add_argument('--sqlite-path', default='bench.sqlite3', help="SQLite file to seed")
+    parser.add_argument('--reset', action='store_true', help="drop and re-seed the benchmark database")
+    parser.add_argument('--students', type=int, default=500)
+    parser.add_argument('--teachers', type=int, default=20)
+    parser.add_argument('--quizzes', type=int, default=20)
+    parser.add_argument('--questions', type=int, default=20, help="questions per quiz")
+    parser.add_argument('--options', type=int, default=4, help="options per question / poll")
+    parser.add_argument('--polls', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=2000, help="forum posts")
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--scenarios', default=','.join(NAMES))
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write the results to this JSON file")
+    parser.add_argument('--compare', help="baseline JSON file from an earlier --save")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed p95 slowdown (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    args.sqlite_path = os.path.abspath(args.sqlite_path)
+    if args.backend == 'mysql' and args.database == config.DB_NAME:
+        sys.exit(f"refusing to seed the app's own database {config.DB_NAME!r}")
+    if args.backend == 'sqlite' and args.sqlite_path == os.path.abspath(config.SQLITE_PATH):
+        sys.exit(f"refusing to seed the app's own database {config.SQLITE_PATH!r}")
+    create_database(args)
+    save, baseline = [os.path.abspath(p) if p else None for p in (args.save, args.compare)]
+
+    # point the app at the benchmark database and keep its files out of the tree
+    config.DB_BACKEND = args.backend
+    config.DB_NAME = args.database
+    config.SQLITE_PATH = args.sqlite_path
+    config.JOBS_DB = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'jobs.sqlite3')
+    os.chdir(os.path.dirname(config.JOBS_DB))
+    from app import app
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    scenarios = Scenarios(app, *seed(args, rng))
+
+    results = {}
+    print(f"{'scenario':<12} {'req':>6} {'fail':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          f" {'queries':>8} {'db ms':>7}")
+    for name in args.scenarios.split(','):
+        r = results[name] = run(scenarios, name, args.requests, args.concurrency)
+        print(f"{name:<12} {r['requests']:>6} {r['failures']:>5} {r['throughput']:>8} {r['p50_ms']:>8}"
+              f" {r['p95_ms']:>8} {r['p99_ms']:>8} {r['queries_per_request']:>8} {r['db_ms_per_request']:>7}")
+
+    if save:
+        with open(save, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import config
+import db
+import uploads
+
+# Content-addressed storage for uploaded files. Each distinct file is kept
+# once at BLOB_FOLDER/ab/cd/<sha256>, and the blobs table counts how many
+# rows (assignment_submissions, resources) point at it.
+#
+# Reference changes happen inside the caller's transaction: add_ref() takes
+# the row lock on the blob before the file is put in place, and gc() only
+# removes a blob while holding that same lock with refcount at zero, so an
+# upload and a collection of the same content can't interleave badly.
+
+
+def blob_path(sha256):
+    return os.path.join(config.BLOB_FOLDER, sha256[:2], sha256[2:4], sha256)
+
+
+def add_ref(cur, file):
+    """Store an uploaded FileStorage and take a reference on it.
+
+    Must run in the transaction that inserts the referencing row; returns
+    the sha256 to store on that row. Identical content is written once.
+    """
+    spool = uploads.spool(file)
+    sha256 = spool.sha256
+    cur.execute(db.backend.upsert('blobs', ('sha256', 'size', 'refcount'), 'sha256',
+                                  'refcount = refcount + 1, updated_at = NOW()'),
+                (sha256, spool.size, 1))
+
+    path = blob_path(sha256)
+    if os.path.exists(path):
+        spool.discard()
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        spool.commit(path)
+    return sha256
+
+
+def release(cur, sha256):
+    if sha256:
+        cur.execute("UPDATE blobs SET refcount = refcount - 1, updated_at = NOW() WHERE sha256 = %s", (sha256,))
+
+
+def gc(conn, grace=None):
+    """Delete blobs nobody has referenced for `grace` seconds, plus files
+    left in the store without a row (upload rolled back after the rename).
+    Returns the number of files removed."""
+    grace = config.BLOB_GC_GRACE if grace is None else grace
+    removed = 0
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT sha256 FROM blobs
+        WHERE refcount <= 0 AND updated_at < %s
+    """, (datetime.now() - timedelta(seconds=grace),))
+    candidates = [row[0] for row in cur.fetchall()]
+    conn.commit()
+
+    for sha256 in candidates:
+        cur.execute("SELECT refcount FROM blobs WHERE sha256 = %s" + db.backend.for_update(cur), (sha256,))
+        row = cur.fetchone()
+        if row is not None and row[0] <= 0:
+            try:
+                os.unlink(blob_path(sha256))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            cur.execute("DELETE FROM blobs WHERE sha256 = %s", (sha256,))
+        conn.commit()
+
+    cutoff = time.time() - grace
+    for dirpath, _, filenames in os.walk(config.BLOB_FOLDER):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            # the locking read also waits for an upload of this content that
+            # hasn't committed its row yet
+            cur.execute("SELECT 1 FROM blobs WHERE sha256 = %s" + db.backend.for_update(cur), (name,))
+            if cur.fetchone() is None:
+                try:
+                    os.unlink(path)
+                    removed += 1
+                except OSError:
+                    pass
+            conn.commit()
+
+    cur.close()
+    return removed
@@ -0,0 +1,150 @@
+import csv
+import heapq
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import config
+import db
+import users
+
+# Bulk student import: rows are read and validated one at a time from the
+# uploaded CSV/JSONL, collected into batches of BULK_IMPORT_BATCH, hashed in
+# a worker pool and written with one multi-row INSERT per batch. Memory
+# grows with the batch size, not the file: the report is two counts plus
+# the first BULK_IMPORT_MAX_ERRORS rejected rows. The one exception is the
+# set of usernames already seen, needed to catch duplicates within the file.
+
+
+def read_rows(stream, fmt):
+    # yields (line number, dict) without loading the whole file
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            if None in row:
+                # DictReader puts the values past the header in a list under None
+                yield reader.line_num, ValueError("too many columns")
+                continue
+            yield reader.line_num, {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+    else:
+        for line_no, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f"invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield line_no, ValueError("each line must be a JSON object")
+                continue
+            yield line_no, {str(k).strip().lower(): str(v).strip() for k, v in row.items() if v is not None}
+
+
+def validate(row):
+    # returns an error message, or None if the row can be imported
+    missing = [f for f in users.FORM_FIELDS if not row.get(f)]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if '@' not in row['email']:
+        return "invalid email"
+    if row['sexe'] not in users.SEXES:
+        return f"sexe must be one of {', '.join(users.SEXES)}"
+    try:
+        datetime.strptime(row['birth_date'], '%Y-%m-%d')
+    except ValueError:
+        return "birth_date must be YYYY-MM-DD"
+    return None
+
+
+class Importer:
+    def __init__(self, conn, hash_password, executor, batch_size):
+        self.conn = conn
+        self.hash_password = hash_password
+        self.executor = executor
+        self.batch_size = batch_size
+        self.created = 0
+        self.failed = 0
+        self._errors = []  # heap of the lowest-numbered rejected lines, as (-line, n, row)
+        self.seen = set()
+        self.batch = []
+
+    def error(self, line_no, username, message):
+        self.failed += 1
+        entry = (-line_no, self.failed, {'line': line_no, 'username': username, 'error': message})
+        if len(self._errors) < config.BULK_IMPORT_MAX_ERRORS:
+            heapq.heappush(self._errors, entry)
+        else:
+            heapq.heappushpop(self._errors, entry)
+
+    def errors(self):
+        return sorted((row for _, _, row in self._errors), key=lambda r: r['line'])
+
+    def add(self, line_no, row):
+        if isinstance(row, Exception):
+            return self.error(line_no, None, str(row))
+        message = validate(row)
+        username = row.get('username')
+        if message is None and username.lower() in self.seen:
+            message = "duplicate username in file"
+        if message:
+            return self.error(line_no, username, message)
+        self.seen.add(username.lower())
+        self.batch.append((line_no, row))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        cur = self.conn.cursor()
+        try:
+            names = [row['username'] for _, row in batch]
+            cur.execute(f"SELECT Username FROM Users WHERE Username IN ({','.join(['%s'] * len(names))})", names)
+            taken = {r[0].lower() for r in cur.fetchall()}
+            fresh = []
+            for line_no, row in batch:
+                if row['username'].lower() in taken:
+                    self.error(line_no, row['username'], "username already exists")
+                else:
+                    fresh.append((line_no, row))
+            batch = fresh
+
+            hashes = self.executor.map(self.hash_password, [row['password'] for _, row in batch])
+            now = datetime.now()
+            rows = [users.user_row(row, pw, 3, now) for (_, row), pw in zip(batch, hashes)]
+            try:
+                db.insert_many(cur, 'Users', users.COLUMNS, rows)
+                self.conn.commit()
+                self._created(batch)
+            except db.IntegrityError:
+                # something else is unique (email?); find the offending rows one by one
+                self.conn.rollback()
+                for (line_no, row), values in zip(batch, rows):
+                    try:
+                        users.insert_user(cur, values)
+                        self.conn.commit()
+                        self._created([(line_no, row)])
+                    except db.IntegrityError as e:
+                        self.conn.rollback()
+                        self.error(line_no, row['username'], str(e))
+        finally:
+            cur.close()
+
+    def _created(self, batch):
+        self.created += len(batch)
+
+
+def import_students(conn, stream, fmt, hash_password):
+    """Import students from a CSV (header row with the users.FORM_FIELDS
+    names) or JSONL stream. Returns (number created, number rejected, the
+    first BULK_IMPORT_MAX_ERRORS rejected rows by line)."""
+    with ThreadPoolExecutor(max_workers=config.BULK_IMPORT_HASH_WORKERS) as executor:
+        importer = Importer(conn, hash_password, executor, config.BULK_IMPORT_BATCH)
+        for line_no, row in read_rows(stream, fmt):
+            importer.add(line_no, row)
+        importer.flush()
+    return importer.created, importer.failed, importer.errors()
@@ -2,3 +2,113 @@ DB_HOST = 'localhost'
 DB_USER = 'root'
 DB_PASSWORD = 'Shkshaadu'
 DB_NAME = 'teachme'
+
+# 'mysql' (the DB_* settings above) or 'sqlite' for running on one machine
+DB_BACKEND = 'mysql'
+SQLITE_PATH = 'teachme.sqlite3'
+SQLITE_BUSY_TIMEOUT = 30  # seconds a write waits for another connection's transaction
+
+# uploads: whole-request cap, then per-extension limits checked while streaming
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024
+UPLOAD_SIZE_LIMITS = {
+    'pdf': 25 * 1024 * 1024,
+    'doc': 25 * 1024 * 1024,
+    'docx': 25 * 1024 * 1024,
+    'txt': 5 * 1024 * 1024,
+    'ppt': 100 * 1024 * 1024,
+    'pptx': 100 * 1024 * 1024,
+    'csv': 50 * 1024 * 1024,
+    'jsonl': 50 * 1024 * 1024,
+}
+UPLOAD_STAGING_FOLDER = 'uploads/tmp'  # must be on the same filesystem as the upload folders
+BLOB_FOLDER = 'uploads/blobs'  # content-addressed store, see blobstore.py
+BLOB_GC_GRACE = 3600  # seconds an unreferenced blob is kept before gc removes it
+
+# downloads: 'flask' streams from the worker, 'x-sendfile' (Apache/lighttpd) or
+# 'x-accel-redirect' (nginx, internal location aliased to BLOB_FOLDER) let the proxy do it
+DOWNLOAD_MODE = 'flask'
+DOWNLOAD_ACCEL_PREFIX = '/protected-blobs/'
+DOWNLOAD_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# ZIP downloads of an assignment's submissions (archives.py)
+ARCHIVE_FOLDER = 'uploads/archives'  # archives of assignments past their due date
+ARCHIVE_CHUNK_SIZE = 256 * 1024  # bytes read from a submission at a time
+
+# background jobs (jobs.py)
+JOBS_DB = 'jobs.sqlite3'
+JOB_WORKERS = 2
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10  # seconds, doubled after each failed attempt
+JOB_POLL_INTERVAL = 5  # seconds between checks for delayed/retried jobs
+JOB_STALE_AFTER = 600  # a 'running' job older than this is requeued at startup
+JOB_RETENTION = 7 * 24 * 3600  # finished jobs are kept this long for status lookups
+
+# connection pool
+DB_POOL_MIN_SIZE = 2
+DB_POOL_MAX_SIZE = 10
+DB_POOL_TIMEOUT = 5  # seconds to wait for a free connection before giving up
+
+# number of quiz definitions kept in memory (see quiz_store.py)
+QUIZ_CACHE_SIZE = 256
+# seconds a cached quiz is used before it is checked against the DB again;
+# bounds how long an edit made through another worker can go unseen
+QUIZ_CACHE_CHECK_INTERVAL = 2
+# quizzes whose result statistics are kept in memory (see quiz_analytics.py)
+QUIZ_ANALYTICS_CACHE_SIZE = 64
+
+# forum feed
+FORUM_PAGE_SIZE = 20
+FORUM_PREVIEW_CHARS = 300
+
+SEARCH_PAGE_SIZE = 20
+ADMIN_USERS_PAGE_SIZE = 50
+GRADEBOOK_PAGE_SIZE = 50
+
+# CSV/Parquet downloads (exports.py): rows fetched, encoded and sent per batch
+EXPORT_BATCH_SIZE = 1000
+
+# seconds a poll's results are served from memory before re-reading the counters
+POLL_RESULTS_TTL = 5
+
+POLLS_PAGE_SIZE = 10
+
+# live poll results (SSE): at most one update per interval, keep-alive comment otherwise
+POLL_STREAM_INTERVAL = 1
+POLL_STREAM_KEEPALIVE = 15
+POLL_STREAM_MAX_BACKOFF = 30  # longest wait between ticks while they keep failing
+
+# seconds a dashboard count is served from memory before it is re-counted
+COUNTER_TTL = 60
+
+# password hashing (passwords.py): new hashes use PASSWORD_SCHEME; older
+# schemes/costs and legacy SHA-1 are upgraded on the next successful login
+PASSWORD_SCHEME = 'argon2'  # or 'bcrypt'
+ARGON2_TIME_COST = 3
+ARGON2_MEMORY_COST = 64 * 1024  # KiB per hash
+ARGON2_PARALLELISM = 1
+BCRYPT_ROUNDS = 12
+PASSWORD_HASH_WORKERS = 4  # hashes computed at once; memory use is workers * ARGON2_MEMORY_COST
+PASSWORD_HASH_QUEUE_LIMIT = 64  # calls waiting or running before new ones have to wait for room
+PASSWORD_HASH_TIMEOUT = 10  # seconds to wait for room before answering 503
+
+# monitoring (metrics.py): /metrics needs "Authorization: Bearer <token>"; without a
+# token it answers 403 unless METRICS_PUBLIC opts out (only where the app isn't reachable)
+METRICS_TOKEN = None
+METRICS_PUBLIC = False
+SLOW_QUERY_SECONDS = 0.5
+SLOW_QUERY_LOG = None  # file path; slow queries always go to the 'slow_queries' logger
+SLOW_QUERY_LOG_CHARS = 2000  # longer SQL is truncated in the log
+
+# server-side sessions (sessions.py): 'sqlite' is shared by the workers on one machine, 'memory' is per process
+SESSION_STORE = 'sqlite'
+SESSION_DB = 'sessions.sqlite3'
+SESSION_LIFETIME = 7 * 24 * 3600  # idle seconds before a session expires
+SESSION_REFRESH_AFTER = 3600  # an unchanged session's expiry is pushed forward at most this often
+SESSION_PURGE_INTERVAL = 3600
+USER_CONTEXT_TTL = 30  # seconds a user's role/username is cached before being re-read
+USER_CONTEXT_CACHE_SIZE = 10000
+
+# bulk student import (bulk_import.py): rows per INSERT/commit, threads hashing passwords
+BULK_IMPORT_BATCH = 500
+BULK_IMPORT_HASH_WORKERS = 4
+BULK_IMPORT_MAX_ERRORS = 1000  # rejected rows listed in the report; the rest are only counted
@@ -0,0 +1,67 @@
+import threading
+import time
+
+import config
+
+# name -> COUNT query; the per-user ones take the user id as their only parameter
+COUNT_QUERIES = {
+    'users': "SELECT COUNT(*) FROM Users",
+    'quizzes': "SELECT COUNT(*) FROM quizzes",
+    'polls': "SELECT COUNT(*) FROM polls",
+    'forums': "SELECT COUNT(*) FROM Forums",
+    'assignments': "SELECT COUNT(*) FROM assignments",
+    'assignment_submissions': "SELECT COUNT(*) FROM assignment_submissions",
+    'student_attempts': "SELECT COUNT(*) FROM quiz_attempts WHERE user_id = %s",
+    'student_assignments': "SELECT COUNT(*) FROM assignment_submissions WHERE student_id = %s",
+}
+
+
+class Counters:
+    # Counts are read from the DB at most once per ttl and kept up to date in
+    # between by the write routes calling incr(). Other workers' writes show
+    # up once the ttl runs out, so the numbers are never more than ttl stale.
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, name, user_id=None):
+        key = (name, user_id)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None and cached[1] > now:
+                return cached[0]
+
+        cur = conn.cursor()
+        if user_id is None:
+            cur.execute(COUNT_QUERIES[name])
+        else:
+            cur.execute(COUNT_QUERIES[name], (user_id,))
+        value = cur.fetchone()[0]
+        cur.close()
+
+        with self._lock:
+            if len(self._values) >= self.max_entries:
+                self._values = {k: v for k, v in self._values.items() if v[1] > now}
+            self._values[key] = (value, now + self.ttl)
+        return value
+
+    def get_many(self, conn, names, user_id=None):
+        return {name: self.get(conn, name, user_id) for name in names}
+
+    def incr(self, name, user_id=None, delta=1):
+        # only adjust what is cached; a missing entry gets counted on next read
+        key = (name, user_id)
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is not None:
+                self._values[key] = (cached[0] + delta, cached[1])
+
+    def invalidate(self, name, user_id=None):
+        with self._lock:
+            self._values.pop((name, user_id), None)
+
+
+counters = Counters(config.COUNTER_TTL)
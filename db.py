@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import deque
+
+from flask import g, has_app_context
+
+import backends
+import config
+import schema
+
+# the configured engine (see backends.py); routes catch db.IntegrityError /
+# db.Error rather than a driver's exception classes
+backend = backends.get(config.DB_BACKEND)
+Error = backend.Error
+IntegrityError = backend.IntegrityError
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+# set by metrics.init_app: wraps every cursor to time its statements
+cursor_wrapper = None
+
+
+class PooledConnection:
+    # thin proxy so routes can keep calling conn.close() like before;
+    # inside a request the connection is only given back on teardown
+    def __init__(self, pool, raw, request_bound=False):
+        self._pool = pool
+        self._raw = raw
+        self._request_bound = request_bound
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        cur = self._raw.cursor(*args, **kwargs)
+        return cursor_wrapper(cur) if cursor_wrapper else cur
+
+    def close(self):
+        if not self._request_bound:
+            self.release()
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool.put(self._raw)
+
+
+class ConnectionPool:
+    def __init__(self, min_size, max_size, timeout, backend):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.backend = backend
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition()
+        # metrics
+        self.in_use = 0
+        self.checkouts = 0
+        self.exhausted_count = 0
+        self.failed_health_checks = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _connect(self):
+        return self.backend.connect()
+
+    def fill(self):
+        # open min_size connections up front, tolerate the DB being down at startup
+        while self._size < self.min_size:
+            try:
+                conn = self._connect()
+            except Error:
+                break
+            with self._cond:
+                self._idle.append(conn)
+                self._size += 1
+
+    def _healthy(self, conn):
+        try:
+            self.backend.ping(conn)
+            return True
+        except Error:
+            return False
+
+    def get(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.exhausted_count += 1
+                    raise PoolExhausted(f"no free DB connection after {self.timeout}s")
+                waited = True
+                self._cond.wait(remaining)
+
+        if conn is not None and not self._healthy(conn):
+            self.failed_health_checks += 1
+            try:
+                conn.close()
+            except Error:
+                pass
+            conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+
+        elapsed = time.monotonic() - start
+        with self._cond:
+            self.in_use += 1
+            self.checkouts += 1
+            if waited:
+                self.total_wait += elapsed
+                self.max_wait = max(self.max_wait, elapsed)
+        return conn
+
+    def put(self, conn):
+        try:
+            # don't hand a half-finished transaction to the next request
+            if conn.in_transaction:
+                conn.rollback()
+            ok = True
+        except Error:
+            ok = False
+        with self._cond:
+            self.in_use -= 1
+            if ok:
+                self._idle.append(conn)
+            else:
+                self._size -= 1
+            self._cond.notify()
+        if not ok:
+            try:
+                conn.close()
+            except Error:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'checkouts': self.checkouts,
+                'exhausted_count': self.exhausted_count,
+                'failed_health_checks': self.failed_health_checks,
+                'total_wait_seconds': round(self.total_wait, 6),
+                'max_wait_seconds': round(self.max_wait, 6),
+            }
+
+
+pool = ConnectionPool(
+    min_size=config.DB_POOL_MIN_SIZE,
+    max_size=config.DB_POOL_MAX_SIZE,
+    timeout=config.DB_POOL_TIMEOUT,
+    backend=backend,
+)
+
+
+def insert_many(cursor, table, columns, rows, batch_size=500):
+    # multi-row INSERT ... VALUES (..), (..) so n rows cost n/batch_size round trips
+    rows = list(rows)
+    placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    prefix = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+        cursor.execute(prefix + ', '.join([placeholder] * len(batch)),
+                       [value for row in batch for value in row])
+
+
+def get_connection():
+    # one connection per request, shared by every get_connection() call in it
+    if has_app_context():
+        conn = g.get('db_conn')
+        if conn is None:
+            conn = PooledConnection(pool, pool.get(), request_bound=True)
+            g.db_conn = conn
+        return conn
+    return PooledConnection(pool, pool.get())
+
+
+def release_connection(exc=None):
+    conn = g.pop('db_conn', None)
+    if conn is not None:
+        conn.release()
+
+
+def init_app(app):
+    app.teardown_appcontext(release_connection)
+    pool.fill()
+    try:
+        conn = PooledConnection(pool, pool.get())
+    except (Error, PoolExhausted):
+        return  # DB not reachable yet, schema gets checked on the next start
+    try:
+        for name, error in schema.migrate(conn, backend):
+            app.logger.warning("could not create %s: %s", name, error)
+    except Error as e:
+        app.logger.warning("could not check schema: %s", e)
+    finally:
+        conn.close()
@@ -0,0 +1,58 @@
+import mimetypes
+import os
+
+from flask import Response, request, send_file
+from werkzeug.http import quote_etag
+
+import blobstore
+import config
+
+
+def blob_version(sha256):
+    # short hash put in download URLs (?v=...) so a URL always means the same bytes
+    return sha256[:16] if sha256 else None
+
+
+def send_blob(sha256, download_name, as_attachment=False):
+    """Response for a stored blob with a strong ETag (its sha256).
+
+    Conditional and Range requests are answered by Werkzeug, or by the front
+    proxy in the x-sendfile / x-accel-redirect modes. When the URL carries
+    the blob's version the response may be cached for a year; otherwise the
+    client revalidates every time, which costs a 304 and no body.
+    """
+    path = os.path.abspath(blobstore.blob_path(sha256))
+    versioned = request.args.get('v') == blob_version(sha256)
+
+    if config.DOWNLOAD_MODE == 'x-accel-redirect':
+        # nginx serves the bytes (and Range); we still answer 304s ourselves
+        if sha256 in request.if_none_match:
+            rv = Response(status=304)
+        else:
+            rv = Response()
+            rv.headers['X-Accel-Redirect'] = config.DOWNLOAD_ACCEL_PREFIX + os.path.relpath(
+                blobstore.blob_path(sha256), config.BLOB_FOLDER).replace(os.sep, '/')
+            rv.content_type = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+            rv.headers.set('Content-Disposition', 'attachment' if as_attachment else 'inline',
+                           filename=download_name)
+        rv.headers['ETag'] = quote_etag(sha256)
+    else:
+        # in x-sendfile mode USE_X_SENDFILE makes send_file hand the path to the proxy
+        rv = send_file(path, download_name=download_name, as_attachment=as_attachment,
+                       etag=sha256, conditional=True, max_age=0)
+
+    rv.cache_control.public = False
+    rv.cache_control.private = True
+    if versioned:
+        rv.cache_control.no_cache = None
+        rv.cache_control.max_age = config.DOWNLOAD_IMMUTABLE_MAX_AGE
+        rv.cache_control.immutable = True
+    else:
+        rv.cache_control.max_age = None
+        rv.cache_control.no_cache = True
+    rv.headers.pop('Expires', None)  # send_file sets one from max_age
+    return rv
+
+
+def init_app(app):
+    app.config['USE_X_SENDFILE'] = config.DOWNLOAD_MODE == 'x-sendfile'
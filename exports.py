@@ -0,0 +1,155 @@
+import csv
+import io
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import Response, stream_with_context
+
+import config
+
+# Downloads of query results that never hold the whole result in memory:
+# rows are pulled from the cursor EXPORT_BATCH_SIZE at a time (MySQL's
+# default cursor is unbuffered, so the server streams them; SQLite steps
+# through the result) and each batch is encoded and sent before the next
+# is fetched. A CSV batch becomes a chunk of lines, a Parquet batch a row
+# group; either way a worker holds about one batch.
+#
+# COLUMNS for an export are (name, pyarrow type) pairs in SELECT order.
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# name -> (sql taking the assignment / quiz id, columns) for the teacher downloads
+QUERIES = {
+    'submissions': ("""
+        SELECT s.id, s.student_id, u.Username, u.Name, u.Surname, s.file, s.blob_sha256, s.submitted_at
+        FROM assignment_submissions s
+        JOIN Users u ON s.student_id = u.ID
+        WHERE s.assignment_id = %s
+        ORDER BY s.id
+    """, [
+        ('submission_id', pa.int64()),
+        ('student_id', pa.int64()),
+        ('username', pa.string()),
+        ('name', pa.string()),
+        ('surname', pa.string()),
+        ('file', pa.string()),
+        ('sha256', pa.string()),
+        ('submitted_at', pa.timestamp('us')),
+    ]),
+    'quiz_attempts': ("""
+        SELECT qa.id, qa.user_id, u.Username, qa.score, qa.taken_at
+        FROM quiz_attempts qa
+        JOIN Users u ON qa.user_id = u.ID
+        WHERE qa.quiz_id = %s
+        ORDER BY qa.id
+    """, [
+        ('attempt_id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('username', pa.string()),
+        ('score', pa.int64()),
+        ('taken_at', pa.timestamp('us')),
+    ]),
+    'quiz_answers': ("""
+        SELECT qa.id, qa.user_id, u.Username, ans.question_id, ans.selected_option_id,
+               o.option_text, COALESCE(o.is_correct, 0)
+        FROM quiz_attempts qa
+        JOIN Users u ON qa.user_id = u.ID
+        JOIN quiz_answers ans ON ans.attempt_id = qa.id
+        LEFT JOIN quiz_options o ON o.id = ans.selected_option_id
+        WHERE qa.quiz_id = %s
+        ORDER BY qa.id, ans.question_id
+    """, [
+        ('attempt_id', pa.int64()),
+        ('user_id', pa.int64()),
+        ('username', pa.string()),
+        ('question_id', pa.int64()),
+        ('option_id', pa.int64()),
+        ('option_text', pa.string()),
+        ('correct', pa.int8()),
+    ]),
+}
+
+
+def iter_batches(conn, sql, params=(), batch_size=None):
+    # the cursor stays open until the last batch has been read
+    batch_size = batch_size or config.EXPORT_BATCH_SIZE
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def csv_chunks(batches, columns):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow([name for name, _ in columns])
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+class ChunkSink(io.RawIOBase):
+    # write-only, unseekable file (for ParquetWriter, ZipFile) whose bytes are taken out as they come
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_chunks(batches, columns):
+    schema = pa.schema(columns)
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for rows in batches:
+            writer.write_table(pa.Table.from_pylist(
+                [dict(zip(schema.names, row)) for row in rows], schema=schema))
+            yield sink.take()
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def export_response(conn, sql, params, columns, fmt, filename):
+    """Streamed download of a query's rows as CSV or Parquet, or None for an
+    unknown format."""
+    if fmt not in FORMATS:
+        return None
+    encode = csv_chunks if fmt == 'csv' else parquet_chunks
+    rv = Response(stream_with_context(encode(iter_batches(conn, sql, params), columns)),
+                  content_type=FORMATS[fmt])
+    rv.headers.set('Content-Disposition', 'attachment', filename=f"{filename}.{fmt}")
+    return rv
+
+
+def export_query(conn, name, object_id, fmt):
+    sql, columns = QUERIES[name]
+    return export_response(conn, sql, (object_id,), columns, fmt, f"{name}_{object_id}")
@@ -0,0 +1,120 @@
+import pyarrow as pa
+
+import db
+import pagination
+import schema
+
+# One row per (student, course) summarizing quizzes and assignments, so the
+# gradebook is a plain read instead of aggregating quiz_attempts and
+# assignment_submissions per request. The write routes keep it current with
+# record_attempt() / record_submission(), in the same transaction as their
+# own insert; rebuild() recomputes it from those tables if it ever drifts.
+#
+# quiz_score is the sum of the student's best score on each quiz taken,
+# quiz_max the sum of those quizzes' best possible scores: the number of
+# questions that have a correct option (len(answer_key) in submit_quiz,
+# the same count in schema.TABLE_BACKFILL).
+
+COLUMNS = ('student_id', 'course_id', 'quiz_attempts', 'quizzes_taken', 'quiz_score', 'quiz_max',
+           'last_quiz_at', 'assignments_submitted', 'last_submission_at')
+
+# (name, pyarrow type) of the exported columns, in SELECT order (see exports.py)
+EXPORT_COLUMNS = [
+    ('student_id', pa.int64()),
+    ('username', pa.string()),
+    ('name', pa.string()),
+    ('surname', pa.string()),
+    ('course_id', pa.int64()),
+    ('quiz_attempts', pa.int64()),
+    ('quizzes_taken', pa.int64()),
+    ('quiz_score', pa.int64()),
+    ('quiz_max', pa.int64()),
+    ('last_quiz_at', pa.timestamp('s')),
+    ('assignments_submitted', pa.int64()),
+    ('last_submission_at', pa.timestamp('s')),
+]
+
+# students without any activity are listed too, with zeros
+SELECT_SQL = """
+    SELECT u.ID AS student_id, u.Username AS username, u.Name AS name, u.Surname AS surname,
+           COALESCE(g.course_id, 0) AS course_id,
+           COALESCE(g.quiz_attempts, 0) AS quiz_attempts, COALESCE(g.quizzes_taken, 0) AS quizzes_taken,
+           COALESCE(g.quiz_score, 0) AS quiz_score, COALESCE(g.quiz_max, 0) AS quiz_max,
+           g.last_quiz_at AS last_quiz_at,
+           COALESCE(g.assignments_submitted, 0) AS assignments_submitted,
+           g.last_submission_at AS last_submission_at
+    FROM Users u
+    LEFT JOIN gradebook g ON g.student_id = u.ID
+    WHERE u.Role = 3
+"""
+ORDER_SQL = " ORDER BY u.Surname, u.ID, COALESCE(g.course_id, 0)"
+EXPORT_SQL = SELECT_SQL + ORDER_SQL
+
+
+def _add(cur, student_id, course_id, values, update, update_params):
+    # insert the row with `values`, or apply `update` to the existing one
+    row = dict.fromkeys(COLUMNS, 0)
+    row.update(student_id=student_id, course_id=course_id, last_quiz_at=None, last_submission_at=None)
+    row.update(values)
+    cur.execute(db.backend.upsert('gradebook', COLUMNS, 'student_id, course_id', update),
+                [row[c] for c in COLUMNS] + list(update_params))
+
+
+def record_attempt(cur, student_id, quiz_id, score, max_score, taken_at):
+    # call before inserting the attempt itself; caller commits.
+    # The upsert locks the student's gradebook row first, so concurrent
+    # submits are serialized before the earlier attempts are counted (with a
+    # locking read: it sees attempts committed after the transaction began).
+    _add(cur, student_id, 0, {'quiz_attempts': 1, 'last_quiz_at': taken_at},
+         "quiz_attempts = quiz_attempts + 1, last_quiz_at = %s", (taken_at,))
+    cur.execute("SELECT COUNT(*), MAX(score) FROM quiz_attempts WHERE user_id = %s AND quiz_id = %s"
+                + db.backend.for_update(cur), (student_id, quiz_id))
+    previous, best = cur.fetchone()
+    if previous and score <= (best or 0):
+        return
+    first = 0 if previous else 1
+    gain = max(score - (best or 0), 0) if previous else score
+    cur.execute("UPDATE gradebook SET quizzes_taken = quizzes_taken + %s, quiz_score = quiz_score + %s, "
+                "quiz_max = quiz_max + %s WHERE student_id = %s AND course_id = 0",
+                (first, gain, max_score if first else 0, student_id))
+
+
+def record_submission(cur, student_id, assignment_id, submitted_at, new):
+    # new: False when the student replaced an earlier submission; caller commits
+    cur.execute("SELECT COALESCE(course_id, 0) FROM assignments WHERE id = %s", (assignment_id,))
+    row = cur.fetchone()
+    course_id = row[0] if row else 0
+    added = 1 if new else 0
+    _add(cur, student_id, course_id,
+         {'assignments_submitted': added, 'last_submission_at': submitted_at},
+         "assignments_submitted = assignments_submitted + %s, last_submission_at = %s",
+         (added, submitted_at))
+
+
+def rebuild(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM gradebook")
+        cur.execute(schema.TABLE_BACKFILL['gradebook'])
+        conn.commit()
+        cur.execute("SELECT COUNT(*) FROM gradebook")
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
+
+
+def page(conn, cursor_token=None, limit=50):
+    """One page of the gradebook, keyset-paginated on (Surname, ID, course_id).
+    Returns (rows, next_cursor)."""
+    where, params = '', []
+    after = pagination.decode_cursor(cursor_token, 3)
+    if after:
+        where = """ AND (u.Surname > %s OR (u.Surname = %s AND (u.ID > %s
+                         OR (u.ID = %s AND COALESCE(g.course_id, 0) > %s))))"""
+        params = [after[0], after[0], after[1], after[1], after[2]]
+
+    cur = conn.cursor(dictionary=True)
+    cur.execute(SELECT_SQL + where + ORDER_SQL + " LIMIT %s", params + [limit + 1])
+    rows = cur.fetchall()
+    cur.close()
+    return pagination.split_page(rows, limit, lambda r: (r['surname'], r['student_id'], r['course_id']))
@@ -0,0 +1,184 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+import traceback
+
+import config
+
+log = logging.getLogger(__name__)
+
+# Background jobs for work that shouldn't hold up a request. The queue lives
+# in a local SQLite file so queued jobs survive a restart; a small pool of
+# worker threads runs them inside an app context (get_db_connection works),
+# retrying failures with exponential backoff.
+#
+#     @jobs.task('gc_blobs')
+#     def gc_blobs(): ...
+#
+#     job_id = jobs.enqueue('gc_blobs', delay=3600, unique=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    owner_id INTEGER,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after);
+"""
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_tasks = {}
+_app = None
+_wakeup = threading.Condition()
+_local = threading.local()
+
+
+def task(name):
+    def decorator(f):
+        _tasks[name] = f
+        return f
+    return decorator
+
+
+def _db():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(config.JOBS_DB, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        _local.conn = conn
+    return conn
+
+
+def enqueue(name, *args, delay=0, max_attempts=None, owner_id=None, unique=False):
+    """Queue a job and return its id. With unique=True an identical job that
+    is still waiting to run is reused instead of queueing another one."""
+    if name not in _tasks:
+        raise KeyError(f"unknown job {name!r}")
+    payload = json.dumps(args, default=str)
+    now = time.time()
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if unique:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE name = ? AND args = ? AND status = ?",
+                (name, payload, QUEUED)).fetchone()
+            if row:
+                conn.execute("COMMIT")
+                return row['id']
+        cur = conn.execute("""
+            INSERT INTO jobs (name, args, status, max_attempts, run_after, owner_id, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (name, payload, QUEUED, max_attempts or config.JOB_MAX_ATTEMPTS, now + delay, owner_id, now, now))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    with _wakeup:
+        _wakeup.notify()
+    return cur.lastrowid
+
+
+def status(job_id):
+    row = _db().execute("""
+        SELECT id, name, status, attempts, max_attempts, run_after, owner_id, last_error, created_at, updated_at
+        FROM jobs WHERE id = ?
+    """, (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def stats():
+    rows = _db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+    return {row['status']: row['n'] for row in rows}
+
+
+def _claim():
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("""
+            SELECT id, name, args, attempts, max_attempts FROM jobs
+            WHERE status = ? AND run_after <= ?
+            ORDER BY run_after, id LIMIT 1
+        """, (QUEUED, now)).fetchone()
+        if row:
+            conn.execute("UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                         (RUNNING, now, row['id']))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return row
+
+
+def _finish(job, error=None):
+    now = time.time()
+    attempts = job['attempts'] + 1
+    if error is None:
+        _db().execute("UPDATE jobs SET status = ?, last_error = NULL, updated_at = ? WHERE id = ?",
+                      (DONE, now, job['id']))
+    elif attempts >= job['max_attempts']:
+        _db().execute("UPDATE jobs SET status = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                      (FAILED, error, now, job['id']))
+    else:
+        backoff = config.JOB_RETRY_DELAY * 2 ** (attempts - 1)
+        _db().execute("UPDATE jobs SET status = ?, last_error = ?, run_after = ?, updated_at = ? WHERE id = ?",
+                      (QUEUED, error, now + backoff, now, job['id']))
+
+
+def run_one():
+    # claim and run one due job; returns False if there was nothing to do
+    job = _claim()
+    if job is None:
+        return False
+    try:
+        with _app.app_context():
+            _tasks[job['name']](*json.loads(job['args']))
+    except Exception:
+        log.exception("job %s (%s) failed", job['id'], job['name'])
+        _finish(job, traceback.format_exc(limit=5))
+    else:
+        _finish(job)
+    return True
+
+
+def _worker():
+    while True:
+        try:
+            if run_one():
+                continue
+        except Exception:
+            log.exception("job worker error")
+        with _wakeup:
+            _wakeup.wait(config.JOB_POLL_INTERVAL)
+
+
+def _housekeeping():
+    conn = _db()
+    conn.executescript(SCHEMA)
+    # anything 'running' for this long was interrupted by a shutdown or crash
+    conn.execute("UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                 (QUEUED, time.time(), RUNNING, time.time() - config.JOB_STALE_AFTER))
+    conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                 (DONE, FAILED, time.time() - config.JOB_RETENTION))
+
+
+def init_app(app):
+    global _app
+    _app = app
+    _housekeeping()
+    for i in range(config.JOB_WORKERS):
+        threading.Thread(target=_worker, name=f'job-worker-{i}', daemon=True).start()
@@ -0,0 +1,149 @@
+import logging
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+import config
+import db
+import jobs
+import passwords
+
+# Request and SQL instrumentation exported in Prometheus format on /metrics.
+# Every cursor handed out by db.get_connection() is a TimedCursor, so each
+# request knows how many statements it ran and how long it spent in MySQL;
+# statements slower than SLOW_QUERY_SECONDS are also logged with their SQL.
+# Labels use the Flask endpoint name (not the URL) to keep cardinality fixed.
+
+slow_log = logging.getLogger('slow_queries')
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Time spent handling a request',
+                            ['endpoint', 'method'])
+REQUESTS = Counter('http_requests_total', 'Requests handled, by response status',
+                   ['endpoint', 'method', 'status'])
+REQUEST_QUERIES = Histogram('db_queries_per_request', 'SQL statements run by a request', ['endpoint'],
+                            buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500))
+REQUEST_DB_TIME = Histogram('db_time_per_request_seconds', 'Time a request spent executing and fetching SQL',
+                            ['endpoint'])
+QUERY_LATENCY = Histogram('db_query_duration_seconds', 'Time to execute one SQL statement', ['endpoint'])
+SLOW_QUERIES = Counter('db_slow_queries_total', 'Statements slower than SLOW_QUERY_SECONDS', ['endpoint'])
+
+
+def _endpoint():
+    if not has_request_context():
+        return 'background'  # jobs, CLI commands, startup
+    return request.endpoint or 'unmatched'
+
+
+def _record(sql, seconds):
+    # sql is None for fetches: they add to the request's DB time but aren't statements
+    if has_request_context():
+        g.db_time = g.get('db_time', 0.0) + seconds
+        if sql is not None:
+            g.db_queries = g.get('db_queries', 0) + 1
+    if sql is None:
+        return
+    endpoint = _endpoint()
+    QUERY_LATENCY.labels(endpoint).observe(seconds)
+    if seconds >= config.SLOW_QUERY_SECONDS:
+        SLOW_QUERIES.labels(endpoint).inc()
+        text = ' '.join(str(sql).split())[:config.SLOW_QUERY_LOG_CHARS]
+        slow_log.warning("slow query %.3fs endpoint=%s sql=%s", seconds, endpoint, text)
+
+
+class TimedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def _timed(self, sql, method, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            _record(sql, time.perf_counter() - started)
+
+    def execute(self, operation, *args, **kwargs):
+        return self._timed(operation, self._cursor.execute, operation, *args, **kwargs)
+
+    def executemany(self, operation, *args, **kwargs):
+        return self._timed(operation, self._cursor.executemany, operation, *args, **kwargs)
+
+    def fetchone(self):
+        return self._timed(None, self._cursor.fetchone)
+
+    def fetchmany(self, *args, **kwargs):
+        return self._timed(None, self._cursor.fetchmany, *args, **kwargs)
+
+    def fetchall(self):
+        return self._timed(None, self._cursor.fetchall)
+
+
+class PoolCollector:
+    # gauges read from the pools' own stats() at scrape time
+    def describe(self):
+        return []  # don't let register() run collect() before the job queue exists
+
+    def collect(self):
+        stats = db.pool.stats()
+        conns = GaugeMetricFamily('db_pool_connections', 'Pooled MySQL connections', labels=['state'])
+        conns.add_metric(['in_use'], stats['in_use'])
+        conns.add_metric(['idle'], stats['idle'])
+        yield conns
+        yield CounterMetricFamily('db_pool_exhausted', 'Checkouts that timed out waiting for a connection',
+                                  value=stats['exhausted_count'])
+
+        stats = passwords.pool.stats()
+        yield GaugeMetricFamily('password_hash_queue_depth', 'Hash/verify calls waiting for a worker',
+                                value=stats['queue_depth'])
+        yield GaugeMetricFamily('password_hash_running', 'Hash/verify calls in progress',
+                                value=stats['running'])
+        yield CounterMetricFamily('password_hash_rejected', 'Calls turned away with 503 because the queue was full',
+                                  value=stats['rejected'])
+
+        queued = GaugeMetricFamily('jobs', 'Background jobs by status', labels=['status'])
+        for status, n in jobs.stats().items():
+            queued.add_metric([status], n)
+        yield queued
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint, method = _endpoint(), request.method
+        REQUEST_LATENCY.labels(endpoint, method).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint, method, str(response.status_code)).inc()
+        REQUEST_QUERIES.labels(endpoint).observe(g.get('db_queries', 0))
+        REQUEST_DB_TIME.labels(endpoint).observe(g.get('db_time', 0.0))
+    return response
+
+
+def export():
+    return Response(generate_latest(REGISTRY), mimetype=CONTENT_TYPE_LATEST)
+
+
+_collector = None
+
+
+def init_app(app):
+    global _collector
+    db.cursor_wrapper = TimedCursor
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    if _collector is None:
+        _collector = PoolCollector()
+        REGISTRY.register(_collector)
+    if config.SLOW_QUERY_LOG:
+        handler = logging.FileHandler(config.SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        slow_log.addHandler(handler)
@@ -0,0 +1,37 @@
+import base64
+import json
+
+
+# Opaque keyset cursors: the sort key of the last row on a page, as a
+# url-safe token. Datetimes go through str(), which both backends compare fine.
+
+SCALARS = (str, int, float, type(None))
+
+def encode_cursor(*values):
+    raw = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    # returns the list of values, or None for a missing/garbled token
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    # the values are bound as SQL parameters: nested lists/objects would fail there
+    if not all(isinstance(v, SCALARS) for v in values):
+        return None
+    return values
+
+
+def split_page(rows, limit, key):
+    # callers fetch limit + 1 rows; the extra one only tells us there's more
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(*key(rows[-1]))
+    return rows, None
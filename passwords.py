@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+
+import config
+
+# Password hashing service. argon2/bcrypt are slow on purpose, so hashing and
+# verifying run on a fixed pool of PASSWORD_HASH_WORKERS threads (both
+# libraries release the GIL while they work) instead of on however many
+# request threads a login burst brings in. At most PASSWORD_HASH_QUEUE_LIMIT
+# calls may be waiting or running at once; past that a caller waits up to
+# PASSWORD_HASH_TIMEOUT seconds for room and then gets HashingBusy (503).
+#
+# Stored hashes are recognised by their format: argon2 ($argon2id$...),
+# bcrypt ($2b$...) or the legacy unsalted SHA-1 hex digest. verify_password()
+# also reports whether a hash should be replaced (legacy format or old cost
+# parameters) so login can upgrade it while it has the plain password.
+
+
+class HashingBusy(Exception):
+    pass
+
+
+_argon2 = PasswordHasher(time_cost=config.ARGON2_TIME_COST, memory_cost=config.ARGON2_MEMORY_COST,
+                         parallelism=config.ARGON2_PARALLELISM)
+
+
+def _is_sha1(stored):
+    return len(stored) == 40 and all(c in '0123456789abcdef' for c in stored.lower())
+
+
+def _hash(password):
+    if config.PASSWORD_SCHEME == 'bcrypt':
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(config.BCRYPT_ROUNDS)).decode('ascii')
+    return _argon2.hash(password)
+
+
+def _verify(stored, password):
+    # returns (matches, needs_rehash)
+    if stored.startswith('$argon2'):
+        try:
+            _argon2.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False, False
+        return True, config.PASSWORD_SCHEME != 'argon2' or _argon2.check_needs_rehash(stored)
+    if stored.startswith('$2'):
+        try:
+            ok = bcrypt.checkpw(password.encode('utf-8'), stored.encode('ascii'))
+        except ValueError:
+            return False, False
+        rounds = int(stored.split('$')[2])
+        return ok, ok and (config.PASSWORD_SCHEME != 'bcrypt' or rounds != config.BCRYPT_ROUNDS)
+    if _is_sha1(stored):
+        legacy = hashlib.sha1(password.encode('utf-8')).hexdigest()
+        ok = hmac.compare_digest(legacy, stored.lower())
+        return ok, ok
+    return False, False
+
+
+class HashingPool:
+    def __init__(self, workers, queue_limit):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(queue_limit)
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        self.max_run = 0.0
+
+    def run(self, fn, *args, timeout=None):
+        """Run fn(*args) on the pool and return its result. timeout is how
+        long to wait for a free queue slot (None waits indefinitely)."""
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy()
+        queued = time.monotonic()
+        with self._lock:
+            self.waiting += 1
+        try:
+            return self._executor.submit(self._timed, queued, fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _timed(self, queued, fn, *args):
+        started = time.monotonic()
+        with self._lock:
+            self.waiting -= 1
+            self.running += 1
+            wait = started - queued
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            return fn(*args)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.running -= 1
+                self.completed += 1
+                self.total_run += elapsed
+                self.max_run = max(self.max_run, elapsed)
+
+    def stats(self):
+        with self._lock:
+            done = self.completed or 1
+            return {
+                'scheme': config.PASSWORD_SCHEME,
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+                'queue_depth': self.waiting,
+                'running': self.running,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avg_wait_seconds': round(self.total_wait / done, 6),
+                'max_wait_seconds': round(self.max_wait, 6),
+                'avg_hash_seconds': round(self.total_run / done, 6),
+                'max_hash_seconds': round(self.max_run, 6),
+            }
+
+
+pool = HashingPool(config.PASSWORD_HASH_WORKERS, config.PASSWORD_HASH_QUEUE_LIMIT)
+
+
+def hash_password(password, timeout=config.PASSWORD_HASH_TIMEOUT):
+    return pool.run(_hash, password, timeout=timeout)
+
+
+def verify_password(stored, password, timeout=config.PASSWORD_HASH_TIMEOUT):
+    # (matches, needs_rehash); legacy SHA-1 is cheap enough to check inline
+    if not stored:
+        return False, False
+    if _is_sha1(stored):
+        return _verify(stored, password)
+    return pool.run(_verify, stored, password, timeout=timeout)
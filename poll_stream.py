@@ -0,0 +1,136 @@
+import json
+import logging
+import queue
+import threading
+import time
+
+import config
+import db
+import poll_tallies
+
+log = logging.getLogger(__name__)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _snapshot(payload):
+    return {'options': {str(o[0]): o[2] for o in payload['options']}, 'total': payload['total']}
+
+
+class Broadcaster:
+    # One thread per process watches every poll that has at least one open
+    # stream. Each tick it reads the poll's results (normally straight from
+    # poll_tallies.results, which poll_vote keeps current) and pushes what
+    # changed since the last tick to all subscribers, so any number of votes
+    # in between collapse into a single event per interval.
+    def __init__(self, interval):
+        self.interval = interval
+        self._subscribers = {}  # poll_id -> set of queues
+        self._last = {}  # poll_id -> last snapshot sent
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, poll_id):
+        q = queue.Queue(maxsize=16)
+        with self._lock:
+            self._subscribers.setdefault(poll_id, set()).add(q)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='poll-broadcaster', daemon=True)
+                self._thread.start()
+        return q
+
+    def unsubscribe(self, poll_id, q):
+        with self._lock:
+            subs = self._subscribers.get(poll_id)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self._subscribers[poll_id]
+                    self._last.pop(poll_id, None)
+
+    def _run(self):
+        delay = self.interval
+        while True:
+            time.sleep(delay)
+            delay = self._safe_tick(delay)
+
+    def _safe_tick(self, delay):
+        # returns the wait before the next tick: the interval after a good
+        # one, doubling up to POLL_STREAM_MAX_BACKOFF while they keep failing
+        try:
+            self.tick()
+        except Exception:
+            log.exception("poll broadcaster tick failed")
+            return min(max(delay, self.interval) * 2, config.POLL_STREAM_MAX_BACKOFF)
+        return self.interval
+
+    def tick(self):
+        with self._lock:
+            poll_ids = list(self._subscribers)
+        if not poll_ids:
+            return
+
+        payloads = {}
+        missing = []
+        for poll_id in poll_ids:
+            payload = poll_tallies.results.peek(poll_id)
+            if payload is None:
+                missing.append(poll_id)
+            else:
+                payloads[poll_id] = payload
+        if missing:
+            conn = db.get_connection()
+            try:
+                for poll_id in missing:
+                    payloads[poll_id] = poll_tallies.results.get(conn, poll_id)
+            finally:
+                conn.close()
+
+        for poll_id, payload in payloads.items():
+            if payload is None:
+                continue
+            self.publish(poll_id, _snapshot(payload))
+
+    def publish(self, poll_id, snapshot):
+        with self._lock:
+            last = self._last.get(poll_id)
+            if last == snapshot:
+                return
+            self._last[poll_id] = snapshot
+            subs = list(self._subscribers.get(poll_id, ()))
+        if last is None:
+            event = _sse('snapshot', snapshot)
+        else:
+            changed = {k: v for k, v in snapshot['options'].items() if last['options'].get(k) != v}
+            event = _sse('delta', {'options': changed, 'total': snapshot['total']})
+        for q in subs:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # slow client: drop what it missed and resync with a full snapshot
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+                q.put_nowait(_sse('snapshot', snapshot))
+
+
+broadcaster = Broadcaster(config.POLL_STREAM_INTERVAL)
+
+
+def stream(poll_id, initial):
+    """Generator for a text/event-stream response: a full snapshot first,
+    then the broadcaster's deltas, with a comment line as keep-alive."""
+    q = broadcaster.subscribe(poll_id)
+    try:
+        yield _sse('snapshot', _snapshot(initial))
+        while True:
+            try:
+                yield q.get(timeout=config.POLL_STREAM_KEEPALIVE)
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+    finally:
+        broadcaster.unsubscribe(poll_id, q)
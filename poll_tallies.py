@@ -0,0 +1,118 @@
+import threading
+import time
+
+import config
+
+# poll_options.vote_count is maintained by record_vote() in the same
+# transaction as the poll_votes insert; reconcile() rebuilds it from
+# poll_votes if the two ever drift (e.g. votes deleted by hand).
+
+
+def record_vote(cur, poll_id, option_id, user_id):
+    # returns False if option_id doesn't belong to poll_id; caller commits
+    cur.execute("""
+        UPDATE poll_options SET vote_count = vote_count + 1
+        WHERE id = %s AND poll_id = %s
+    """, (option_id, poll_id))
+    if cur.rowcount != 1:
+        return False
+    cur.execute("""
+      INSERT INTO poll_votes (poll_id, option_id, user_id) VALUES (%s, %s, %s)
+    """, (poll_id, option_id, user_id))
+    return True
+
+
+def reconcile(conn, poll_id=None):
+    cur = conn.cursor()
+    sql = """
+        UPDATE poll_options
+        SET vote_count = (SELECT COUNT(*) FROM poll_votes pv WHERE pv.option_id = poll_options.id)
+    """
+    if poll_id is None:
+        cur.execute(sql)
+    else:
+        cur.execute(sql + " WHERE poll_id = %s", (poll_id,))
+    updated = cur.rowcount
+    conn.commit()
+    cur.close()
+    if poll_id is None:
+        results.clear()
+    else:
+        results.invalidate(poll_id)
+    return updated
+
+
+def load_results(conn, poll_id):
+    cur = conn.cursor()
+    cur.execute("SELECT question FROM polls WHERE id=%s", (poll_id,))
+    poll = cur.fetchone()
+    if not poll:
+        cur.close()
+        return None
+    cur.execute("""
+        SELECT id, option_text, vote_count
+        FROM poll_options
+        WHERE poll_id = %s
+        ORDER BY id
+    """, (poll_id,))
+    options = [list(row) for row in cur.fetchall()]
+    cur.close()
+    return {'poll_id': poll_id, 'question': poll[0], 'options': options,
+            'total': sum(o[2] for o in options)}
+
+
+class ResultsCache:
+    # Results payload per poll_id, refreshed from the counters at most once
+    # per ttl; votes cast through this process are applied straight away.
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, poll_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is not None and entry[1] > now:
+                return self._copy(entry[0])
+
+        payload = load_results(conn, poll_id)
+        if payload is None:
+            return None
+        with self._lock:
+            self._entries[poll_id] = (payload, now + self.ttl)
+            return self._copy(payload)
+
+    def peek(self, poll_id):
+        # cached payload if still fresh, without touching the DB
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is not None and entry[1] > time.monotonic():
+                return self._copy(entry[0])
+        return None
+
+    def add_vote(self, poll_id, option_id):
+        with self._lock:
+            entry = self._entries.get(poll_id)
+            if entry is None:
+                return
+            for option in entry[0]['options']:
+                if option[0] == option_id:
+                    option[2] += 1
+                    entry[0]['total'] += 1
+                    break
+
+    def invalidate(self, poll_id):
+        with self._lock:
+            self._entries.pop(poll_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _copy(payload):
+        return dict(payload, options=[tuple(o) for o in payload['options']])
+
+
+results = ResultsCache(config.POLL_RESULTS_TTL)
@@ -0,0 +1,159 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import config
+
+# Item analysis for a quiz, computed from one fetch of every answer given to
+# it and vectorized over an attempts x questions matrix of 0/1 (correct):
+#
+#   difficulty      share of attempts that got the question right
+#   discrimination  upper-lower index: difficulty among the top 27% of
+#                   attempts by total score minus among the bottom 27%
+#   item_rest       correlation of the question with the score on the other
+#                   questions (near zero or negative: the question measures
+#                   something else, or its key is wrong)
+#
+# and, for every option, how often it was chosen. Scores are recomputed
+# from the current answer key, so they stay consistent with the item stats
+# after a quiz is edited.
+
+GROUP_FRACTION = 0.27
+
+
+def load_answers(conn, quiz_id):
+    # attempts with no answers still count (as all wrong): LEFT JOIN
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT qa.id, ans.question_id, ans.selected_option_id
+        FROM quiz_attempts qa
+        LEFT JOIN quiz_answers ans ON ans.attempt_id = qa.id
+        WHERE qa.quiz_id = %s
+    """, (quiz_id,))
+    rows = cur.fetchall()
+    cur.close()
+    return pd.DataFrame(rows, columns=['attempt_id', 'question_id', 'option_id'])
+
+
+def _num(value, digits=3):
+    # numpy scalar -> JSON-friendly float, NaN -> None
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def analyze(quiz, answers):
+    """Statistics for one quiz (as returned by quiz_store.get_quiz) from the
+    DataFrame load_answers() returns."""
+    questions = quiz['questions']
+    q_ids = [q['id'] for q in questions]
+    attempt_ids = np.sort(answers['attempt_id'].unique())
+    n, k = len(attempt_ids), len(q_ids)
+    result = {'attempts': n, 'questions': k}
+    if n == 0 or k == 0:
+        return dict(result, distribution=[], items=[])
+
+    answered = answers.dropna(subset=['question_id'])
+    answered = answered[answered['question_id'].isin(q_ids)]
+    key = pd.Series(quiz['answer_key'], dtype='float64')
+    correct = answered['option_id'].to_numpy(dtype=float) == key.reindex(answered['question_id']).to_numpy()
+
+    # attempts x questions, 1 where the attempt chose the right option
+    rows = np.searchsorted(attempt_ids, answered['attempt_id'].to_numpy())
+    cols = pd.Index(q_ids).get_indexer(answered['question_id'])
+    X = np.zeros((n, k))
+    X[rows[correct], cols[correct]] = 1.0
+    totals = X.sum(axis=1)
+
+    order = np.argsort(totals, kind='stable')
+    g = max(1, int(round(GROUP_FRACTION * n)))
+    discrimination = X[order[-g:]].mean(axis=0) - X[order[:g]].mean(axis=0)
+
+    rest = totals[:, None] - X
+    xc, rc = X - X.mean(axis=0), rest - rest.mean(axis=0)
+    denominator = np.sqrt((xc ** 2).sum(axis=0) * (rc ** 2).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        item_rest = np.where(denominator > 0, (xc * rc).sum(axis=0) / denominator, np.nan)
+
+    picks = answered.groupby(['question_id', 'option_id']).size()
+    answered_per_question = answered.groupby('question_id').size().reindex(q_ids, fill_value=0).to_numpy()
+
+    distribution = np.bincount(totals.astype(int), minlength=k + 1)
+    result.update(
+        mean=_num(totals.mean()),
+        median=_num(np.median(totals)),
+        std=_num(totals.std()),
+        min=int(totals.min()),
+        max=int(totals.max()),
+        distribution=[{'score': s, 'count': int(c)} for s, c in enumerate(distribution)],
+        items=[{
+            'id': q['id'],
+            'text': q['text'],
+            'difficulty': _num(X[:, j].mean()),
+            'discrimination': _num(discrimination[j]),
+            'item_rest': _num(item_rest[j]),
+            'unanswered': _num(1 - answered_per_question[j] / n),
+            'options': [{
+                'id': opt['id'],
+                'text': opt['text'],
+                'is_correct': opt['is_correct'],
+                'count': int(picks.get((q['id'], opt['id']), 0)),
+                'rate': _num(picks.get((q['id'], opt['id']), 0) / n),
+            } for opt in q['options']],
+        } for j, q in enumerate(questions)],
+    )
+    return result
+
+
+class AnalyticsCache:
+    # Results per quiz_id, stored with the (attempt count, last attempt id)
+    # they were computed from and the version of the quiz they were computed
+    # against. The pair is re-read on every get(), one indexed query, and
+    # the quiz comes fresh from quiz_store, so attempts and questions added
+    # through other workers are picked up too.
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn, quiz):
+        quiz_id = quiz['id']
+        cur = conn.cursor()
+        cur.execute("SELECT COUNT(*), MAX(id) FROM quiz_attempts WHERE quiz_id = %s", (quiz_id,))
+        fingerprint = tuple(cur.fetchone()) + (quiz['version'],)
+        cur.close()
+
+        with self._lock:
+            entry = self._entries.get(quiz_id)
+            if entry is not None and entry[0] == fingerprint:
+                self._entries.move_to_end(quiz_id)
+                return entry[1]
+            version = self._versions.get(quiz_id, 0)
+
+        result = analyze(quiz, load_answers(conn, quiz_id))
+
+        with self._lock:
+            if self._versions.get(quiz_id, 0) == version:
+                self._entries[quiz_id] = (fingerprint, result)
+                self._entries.move_to_end(quiz_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, quiz_id):
+        with self._lock:
+            self._versions[quiz_id] = self._versions.get(quiz_id, 0) + 1
+            self._entries.pop(quiz_id, None)
+
+
+cache = AnalyticsCache(config.QUIZ_ANALYTICS_CACHE_SIZE)
+
+
+def get_analytics(conn, quiz):
+    return cache.get(conn, quiz)
+
+
+def invalidate(quiz_id):
+    cache.invalidate(quiz_id)
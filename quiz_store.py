@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+
+import config
+
+
+def load_quiz(conn, quiz_id):
+    """Load a quiz with all its questions and options.
+
+    Two queries whatever the number of questions: the quiz row, then
+    questions LEFT JOIN options in one pass. Returns None if the quiz
+    doesn't exist, otherwise a dict like
+
+        {'id', 'title', 'description',
+         'questions': [{'id', 'text', 'options': [{'id', 'text', 'is_correct'}]}],
+         'answer_key': {question_id: correct_option_id},
+         'version': (question count, highest question id)}
+    """
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT id, title, description FROM quizzes WHERE id=%s", (quiz_id,))
+        row = cur.fetchone()
+        if not row:
+            return None
+
+        cur.execute("""
+            SELECT q.id, q.question_text, o.id, o.option_text, o.is_correct
+            FROM quiz_questions q
+            LEFT JOIN quiz_options o ON o.question_id = q.id
+            WHERE q.quiz_id = %s
+            ORDER BY q.id, o.id
+        """, (quiz_id,))
+        rows = cur.fetchall()
+    finally:
+        cur.close()
+
+    questions = []
+    answer_key = {}
+    current = None
+    # rows come ordered by question, so grouping is a single linear scan
+    for q_id, q_text, o_id, o_text, is_correct in rows:
+        if current is None or current['id'] != q_id:
+            current = {'id': q_id, 'text': q_text, 'options': []}
+            questions.append(current)
+        if o_id is None:
+            continue
+        current['options'].append({'id': o_id, 'text': o_text, 'is_correct': bool(is_correct)})
+        if is_correct:
+            answer_key[q_id] = o_id
+
+    return {
+        'id': row[0],
+        'title': row[1],
+        'description': row[2],
+        'questions': questions,
+        'answer_key': answer_key,
+        'version': (len(questions), max((q['id'] for q in questions), default=None)),
+    }
+
+
+def load_version(conn, quiz_id):
+    # what load_quiz() would put in 'version', from the quiz_questions index alone
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*), MAX(id) FROM quiz_questions WHERE quiz_id = %s", (quiz_id,))
+    row = cur.fetchone()
+    cur.close()
+    return tuple(row)
+
+
+class QuizCache:
+    # LRU of loaded quizzes keyed by quiz_id, as (quiz, time last checked).
+    # Entries are shared between requests: treat them as read-only.
+    # invalidate() bumps the quiz_id's version so that a load still in
+    # flight, which may have read the quiz before the edit, is not stored;
+    # versions are only kept while a load of that quiz is running.
+    #
+    # invalidate() only reaches this process, so once an entry is older than
+    # QUIZ_CACHE_CHECK_INTERVAL its question count and highest question id
+    # are checked against the DB (one indexed query instead of the full
+    # load) and a question added through another worker makes it reload.
+    # Within the interval a hit is a plain dict lookup.
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, conn, quiz_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(quiz_id)
+        checked = entry
+        if entry is not None and now - entry[1] >= config.QUIZ_CACHE_CHECK_INTERVAL:
+            quiz = entry[0]
+            checked = (quiz, now) if quiz['version'] == load_version(conn, quiz_id) else None
+
+        with self._lock:
+            if checked is not None and self._entries.get(quiz_id) is entry:
+                self._entries[quiz_id] = checked
+                self._entries.move_to_end(quiz_id)
+                self.hits += 1
+                return checked[0]
+            self.misses += 1
+            version = self._versions.get(quiz_id, 0)
+            self._loading[quiz_id] = self._loading.get(quiz_id, 0) + 1
+
+        quiz = None
+        try:
+            quiz = load_quiz(conn, quiz_id)
+        finally:
+            with self._lock:
+                if quiz is not None and self._versions.get(quiz_id, 0) == version:
+                    self._entries[quiz_id] = (quiz, now)
+                    self._entries.move_to_end(quiz_id)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+                self._loading[quiz_id] -= 1
+                if not self._loading[quiz_id]:
+                    del self._loading[quiz_id]
+                    self._versions.pop(quiz_id, None)
+        return quiz
+
+    def invalidate(self, quiz_id):
+        with self._lock:
+            if quiz_id in self._loading:
+                self._versions[quiz_id] = self._versions.get(quiz_id, 0) + 1
+            self._entries.pop(quiz_id, None)
+
+    def clear(self):
+        with self._lock:
+            for quiz_id in self._loading:
+                self._versions[quiz_id] = self._versions.get(quiz_id, 0) + 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'max_size': self.max_size,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+cache = QuizCache(config.QUIZ_CACHE_SIZE)
+
+
+def get_quiz(conn, quiz_id):
+    return cache.get(conn, quiz_id)
+
+
+def invalidate(quiz_id):
+    cache.invalidate(quiz_id)
@@ -0,0 +1,234 @@
+# The database schema, applied by migrate() at startup on either backend.
+# Everything is idempotent: tables are created if missing, then columns and
+# indexes added later in the app's life are added where they aren't yet, so
+# an existing MySQL database and a fresh SQLite file end up the same.
+#
+# Table names are spelled as the queries spell them (Users, Forums, the rest
+# lower case); MySQL on Linux and SQLite's sqlite_master lookups care.
+
+# (table, columns, indexes created together with the table); {id} and {now}
+# come from the backend's ddl
+TABLES = [
+    ('Users', '''
+        ID {id},
+        Name VARCHAR(100) NOT NULL,
+        Surname VARCHAR(100) NOT NULL,
+        Username VARCHAR(100) NOT NULL UNIQUE,
+        Email VARCHAR(255) NOT NULL,
+        Birth_date DATE,
+        Registration_date DATETIME,
+        Password VARCHAR(255) NOT NULL,
+        Role INT NOT NULL,
+        Sexe VARCHAR(10)
+    ''', []),
+    ('Forums', '''
+        id {id},
+        Subject VARCHAR(255),
+        Title VARCHAR(255),
+        Content TEXT,
+        UserID INT,
+        Timestamp DATETIME NOT NULL DEFAULT {now}
+    ''', []),
+    ('quizzes', '''
+        id {id},
+        title VARCHAR(255) NOT NULL,
+        description TEXT
+    ''', []),
+    ('quiz_questions', '''
+        id {id},
+        quiz_id INT NOT NULL,
+        question_text TEXT
+    ''', [('idx_quiz_questions_quiz', '(quiz_id)')]),
+    ('quiz_options', '''
+        id {id},
+        question_id INT NOT NULL,
+        option_text VARCHAR(255),
+        is_correct BOOLEAN NOT NULL DEFAULT FALSE
+    ''', [('idx_quiz_options_question', '(question_id)')]),
+    ('quiz_attempts', '''
+        id {id},
+        quiz_id INT NOT NULL,
+        user_id INT NOT NULL,
+        score INT,
+        taken_at DATETIME
+    ''', [('idx_quiz_attempts_user', '(user_id)'), ('idx_quiz_attempts_quiz', '(quiz_id)')]),
+    ('quiz_answers', '''
+        id {id},
+        attempt_id INT NOT NULL,
+        question_id INT NOT NULL,
+        selected_option_id INT
+    ''', [('idx_quiz_answers_attempt', '(attempt_id)')]),
+    ('polls', '''
+        id {id},
+        question VARCHAR(255) NOT NULL,
+        created_by INT,
+        created_at DATETIME NOT NULL DEFAULT {now}
+    ''', []),
+    ('poll_options', '''
+        id {id},
+        poll_id INT NOT NULL,
+        option_text VARCHAR(255)
+    ''', [('idx_poll_options_poll', '(poll_id)')]),
+    ('poll_votes', '''
+        id {id},
+        poll_id INT NOT NULL,
+        option_id INT NOT NULL,
+        user_id INT NOT NULL,
+        voted_at DATETIME NOT NULL DEFAULT {now}
+    ''', []),
+    ('assignments', '''
+        id {id},
+        title VARCHAR(255),
+        description TEXT,
+        due_date DATE,
+        course_id INT
+    ''', []),
+    ('assignment_submissions', '''
+        id {id},
+        assignment_id INT NOT NULL,
+        student_id INT NOT NULL,
+        file VARCHAR(255),
+        submitted_at DATETIME
+    ''', []),
+    ('resources', '''
+        id {id},
+        filename VARCHAR(255),
+        uploaded_by INT,
+        description TEXT,
+        upload_time DATETIME NOT NULL DEFAULT {now}
+    ''', []),
+    ('blobs', '''
+        sha256 CHAR(64) NOT NULL PRIMARY KEY,
+        size BIGINT NOT NULL,
+        refcount INT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NOT NULL DEFAULT {now}
+    ''', [('idx_blobs_refcount', '(refcount, updated_at)')]),
+    # maintained by gradebook.py; course_id 0 = no course (quizzes have none)
+    ('gradebook', '''
+        student_id INT NOT NULL,
+        course_id INT NOT NULL DEFAULT 0,
+        quiz_attempts INT NOT NULL DEFAULT 0,
+        quizzes_taken INT NOT NULL DEFAULT 0,
+        quiz_score INT NOT NULL DEFAULT 0,
+        quiz_max INT NOT NULL DEFAULT 0,
+        last_quiz_at DATETIME NULL,
+        assignments_submitted INT NOT NULL DEFAULT 0,
+        last_submission_at DATETIME NULL,
+        PRIMARY KEY (student_id, course_id)
+    ''', []),
+]
+
+# filled in from the existing data when the table is first created
+TABLE_BACKFILL = {
+    'gradebook': '''
+        INSERT INTO gradebook (student_id, course_id, quiz_attempts, quizzes_taken, quiz_score, quiz_max,
+                               last_quiz_at, assignments_submitted, last_submission_at)
+        SELECT student_id, course_id, SUM(quiz_attempts), SUM(quizzes_taken), SUM(quiz_score), SUM(quiz_max),
+               MAX(last_quiz_at), SUM(assignments_submitted), MAX(last_submission_at)
+        FROM (
+            SELECT b.user_id AS student_id, 0 AS course_id, b.attempts AS quiz_attempts, 1 AS quizzes_taken,
+                   COALESCE(b.best, 0) AS quiz_score, COALESCE(q.questions, 0) AS quiz_max,
+                   b.last_at AS last_quiz_at, 0 AS assignments_submitted, NULL AS last_submission_at
+            FROM (SELECT user_id, quiz_id, COUNT(*) AS attempts, MAX(score) AS best, MAX(taken_at) AS last_at
+                  FROM quiz_attempts GROUP BY user_id, quiz_id) b
+            LEFT JOIN (SELECT qq.quiz_id, COUNT(DISTINCT qq.id) AS questions
+                       FROM quiz_questions qq JOIN quiz_options o ON o.question_id = qq.id
+                       WHERE o.is_correct = 1
+                       GROUP BY qq.quiz_id) q
+                ON q.quiz_id = b.quiz_id
+            UNION ALL
+            SELECT s.student_id, COALESCE(a.course_id, 0), 0, 0, 0, 0,
+                   NULL, COUNT(DISTINCT s.assignment_id), MAX(s.submitted_at)
+            FROM assignment_submissions s
+            LEFT JOIN assignments a ON a.id = s.assignment_id
+            GROUP BY s.student_id, COALESCE(a.course_id, 0)
+        ) t
+        GROUP BY student_id, course_id
+    ''',
+}
+
+# columns added on top of the original schema: (table, column, definition, backfill sql)
+COLUMNS = [
+    ('poll_options', 'vote_count', 'INT NOT NULL DEFAULT 0', '''
+        UPDATE poll_options
+        SET vote_count = (SELECT COUNT(*) FROM poll_votes pv WHERE pv.option_id = poll_options.id)
+    '''),
+    ('assignment_submissions', 'blob_sha256', 'CHAR(64) NULL', None),
+    ('resources', 'blob_sha256', 'CHAR(64) NULL', None),
+]
+
+# VARCHAR columns that must hold at least this many characters: (table, column, length)
+WIDEN = [
+    ('Users', 'Password', 255),  # argon2/bcrypt hashes are longer than a SHA-1 hex digest
+]
+
+# indexes the queries in the app rely on: (table, index name, definition, kind)
+INDEXES = [
+    ('Forums', 'idx_forums_timestamp_id', '(Timestamp, id)', ''),
+    ('Forums', 'ft_forums_text', '(Subject, Title, Content)', 'FULLTEXT'),
+    ('resources', 'ft_resources_text', '(description, filename)', 'FULLTEXT'),
+    ('Users', 'idx_users_role_name', '(Role, Name, ID)', ''),
+    ('Users', 'idx_users_role_surname', '(Role, Surname, ID)', ''),
+    ('Users', 'idx_users_role_username', '(Role, Username, ID)', ''),
+    ('Users', 'idx_users_role_email', '(Role, Email, ID)', ''),
+    ('Users', 'idx_users_role_registered', '(Role, Registration_date, ID)', ''),
+    ('poll_votes', 'uq_poll_votes_poll_user', '(poll_id, user_id)', 'UNIQUE'),
+    ('polls', 'idx_polls_created_id', '(created_at, id)', ''),
+    ('assignment_submissions', 'idx_submissions_assignment_student', '(assignment_id, student_id)', ''),
+    ('assignment_submissions', 'idx_submissions_file', '(file)', ''),
+    ('resources', 'idx_resources_filename', '(filename)', ''),
+]
+
+
+def migrate(conn, backend):
+    # Returns (name, error) for anything that could not be created.
+    failures = []
+    cur = conn.cursor()
+    try:
+        for table, columns, keys in TABLES:
+            if backend.has_table(cur, table):
+                continue
+            try:
+                cur.execute(f"CREATE TABLE {table} ({columns.format(**backend.ddl)})")
+                for name, definition in keys:
+                    cur.execute(backend.create_index_sql(table, name, definition, ''))
+                if table in TABLE_BACKFILL:
+                    cur.execute(TABLE_BACKFILL[table])
+                conn.commit()
+            except backend.Error as e:
+                conn.rollback()
+                failures.append((table, e))
+
+        for table, column, definition, backfill in COLUMNS:
+            if backend.has_column(cur, table, column):
+                continue
+            try:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                if backfill:
+                    cur.execute(backfill)
+                conn.commit()
+            except backend.Error as e:
+                conn.rollback()
+                failures.append((f"{table}.{column}", e))
+
+        for table, column, length in WIDEN:
+            sql = backend.widen_sql(cur, table, column, length)
+            if sql is None:
+                continue
+            try:
+                cur.execute(sql)
+            except backend.Error as e:
+                failures.append((f"{table}.{column}", e))
+
+        for table, name, definition, kind in INDEXES:
+            sql = backend.create_index_sql(table, name, definition, kind)
+            if sql is None or backend.has_index(cur, table, name):
+                continue
+            try:
+                cur.execute(sql)
+                conn.commit()
+            except backend.Error as e:
+                failures.append((name, e))
+    finally:
+        cur.close()
+    return failures
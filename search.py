@@ -0,0 +1,59 @@
+import re
+
+import db
+
+# On MySQL both tables carry InnoDB FULLTEXT indexes (see schema.INDEXES),
+# which are kept current on every INSERT, so new_forum_post and resource
+# uploads need no extra work to become searchable. The match and score
+# expressions come from the backend (db.backend.text_match).
+
+SOURCES = {
+    'forums': ("""
+        SELECT 'forum' AS kind, f.id AS id, f.Title AS title, f.Subject AS subtitle,
+               SUBSTR(f.Content, 1, 200) AS snippet, NULL AS filename, f.Timestamp AS created,
+               {score} AS score
+        FROM Forums f
+        WHERE {match}
+    """, ('f.Subject', 'f.Title', 'f.Content')),
+    'resources': ("""
+        SELECT 'resource' AS kind, r.id AS id, r.filename AS title, NULL AS subtitle,
+               SUBSTR(r.description, 1, 200) AS snippet, r.filename AS filename, r.upload_time AS created,
+               {score} AS score
+        FROM resources r
+        WHERE {match}
+    """, ('r.description', 'r.filename')),
+}
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+MIN_WORD_LEN = 3  # innodb_ft_min_token_size, shorter words are never indexed
+
+
+def search_words(text):
+    # operators typed by the user are dropped
+    return [w for w in _WORD.findall(text) if len(w) >= MIN_WORD_LEN]
+
+
+def search(conn, text, scope='all', page=1, per_page=20):
+    """Ranked full-text search over forum posts and resources.
+
+    Returns (results, has_more) where results is a list of dicts ordered by
+    relevance. scope is 'all' or one of the SOURCES keys.
+    """
+    words = search_words(text)
+    if not words:
+        return [], False
+
+    parts, params = [], []
+    for name in (list(SOURCES) if scope == 'all' else [scope]):
+        sql, columns = SOURCES[name]
+        match, score, match_params, score_params = db.backend.text_match(columns, words)
+        parts.append(sql.format(match=match, score=score))
+        params += score_params + match_params
+    sql = " UNION ALL ".join(parts) + " ORDER BY score DESC, created DESC LIMIT %s OFFSET %s"
+    params += [per_page + 1, (page - 1) * per_page]
+
+    cur = conn.cursor(dictionary=True)
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    cur.close()
+    return rows[:per_page], len(rows) > per_page
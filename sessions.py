@@ -0,0 +1,261 @@
+import hashlib
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import session as current_session
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+
+import config
+import db
+
+# Server-side sessions. The cookie only carries a random session id; the
+# session data lives in SESSION_STORE ('sqlite': a local file shared by the
+# workers on this machine, like the job queue; 'memory': this process only).
+# Ids are stored hashed, so a copy of the store can't be replayed as cookies.
+#
+# Who the user is (username, role) is not trusted from the stored session:
+# open_session() fills it in from a per-process cache of Users rows
+# (UserContexts, USER_CONTEXT_TTL), so authorization is a dict lookup, a
+# role change is picked up within the TTL, and revoke_user() - deleting the
+# user's sessions from the shared store - logs a user out everywhere at once.
+
+CONTEXT_KEYS = ('username', 'role')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    user_id INTEGER,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id);
+CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at);
+"""
+
+
+def _hash(sid):
+    return hashlib.sha256(sid.encode()).hexdigest()
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def setup(self):
+        self._db().executescript(SCHEMA)
+
+    def get(self, key):
+        # (data, expires_at) or None
+        row = self._db().execute("SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?",
+                                 (key, time.time())).fetchone()
+        return row
+
+    def save(self, key, user_id, data, expires_at):
+        self._db().execute("INSERT OR REPLACE INTO sessions (sid, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+                           (key, user_id, data, expires_at))
+
+    def delete(self, key):
+        self._db().execute("DELETE FROM sessions WHERE sid = ?", (key,))
+
+    def delete_user(self, user_id):
+        return self._db().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+
+    def purge(self):
+        return self._db().execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+class MemoryStore:
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def setup(self):
+        pass
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[2] <= time.time():
+            return None
+        return entry[1], entry[2]
+
+    def save(self, key, user_id, data, expires_at):
+        with self._lock:
+            self._data[key] = (user_id, data, expires_at)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            keys = [k for k, entry in self._data.items() if entry[0] == user_id]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+    def purge(self):
+        now = time.time()
+        with self._lock:
+            keys = [k for k, entry in self._data.items() if entry[2] <= now]
+            for k in keys:
+                del self._data[k]
+        return len(keys)
+
+
+class UserContexts:
+    # user_id -> {'username', 'role'}, or None for a user that no longer exists
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+
+        cur = db.get_connection().cursor()
+        cur.execute("SELECT Username, Role FROM Users WHERE ID = %s", (user_id,))
+        row = cur.fetchone()
+        cur.close()
+        context = {'username': row[0], 'role': int(row[1])} if row else None
+
+        with self._lock:
+            self._entries[user_id] = (context, now + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return context
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.stale_sid = None
+        self.error = None
+
+    def regenerate(self):
+        # new id for the same data (call on login, against session fixation)
+        self.stale_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    serializer = session_json_serializer
+
+    def __init__(self, store):
+        self.store = store
+        self._next_purge = 0.0
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        row = self.store.get(_hash(sid)) if sid else None
+        if row is None:
+            return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+        session = ServerSession(self.serializer.loads(row[0]), sid=sid)
+        session.expires_at = row[1]
+        user_id = session.get('user_id')
+        if user_id is not None:
+            try:
+                context = contexts.get(user_id)
+            except db.PoolExhausted as e:
+                # errors raised here skip the app's error handlers (a bare
+                # 500): raise_session_error() re-raises it once the request
+                # is dispatched, so it gets the usual 503
+                session.error = e
+                return session
+            if context is None:
+                # the user was deleted: treat the session as logged out
+                session.clear()
+            else:
+                dict.update(session, context)  # derived, not a modification
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.error is not None:
+            return  # the user's data was never loaded, leave the stored session alone
+        if session.stale_sid:
+            self.store.delete(_hash(session.stale_sid))
+        if not session:
+            if not session.new:
+                self.store.delete(_hash(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        # rewrite an unchanged session only to push its expiry forward
+        if not session.modified and getattr(session, 'expires_at', 0) - now > \
+                config.SESSION_LIFETIME - config.SESSION_REFRESH_AFTER:
+            return
+
+        expires_at = now + config.SESSION_LIFETIME
+        data = {k: v for k, v in session.items() if k not in CONTEXT_KEYS}
+        self.store.save(_hash(session.sid), session.get('user_id'), self.serializer.dumps(data), expires_at)
+        response.set_cookie(name, session.sid, max_age=config.SESSION_LIFETIME, domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                            samesite=self.get_cookie_samesite(app))
+        if now >= self._next_purge:
+            self._next_purge = now + config.SESSION_PURGE_INTERVAL
+            self.store.purge()
+
+
+store = SQLiteStore(config.SESSION_DB) if config.SESSION_STORE == 'sqlite' else MemoryStore()
+contexts = UserContexts(config.USER_CONTEXT_TTL, config.USER_CONTEXT_CACHE_SIZE)
+
+
+def user_changed(user_id):
+    # after changing a user's username/role: this process sees it on the next
+    # request, other workers within USER_CONTEXT_TTL
+    contexts.invalidate(user_id)
+
+
+def revoke_user(user_id):
+    # after deleting (or locking out) a user: end their sessions everywhere now
+    contexts.invalidate(user_id)
+    return store.delete_user(user_id)
+
+
+def raise_session_error():
+    error = getattr(current_session, 'error', None)
+    if error is not None:
+        raise error
+
+
+def init_app(app):
+    store.setup()
+    store.purge()
+    app.session_interface = ServerSessionInterface(store)
+    app.before_request(raise_session_error)
@@ -0,0 +1,108 @@
+import itertools
+import os
+import shutil
+import tempfile
+from datetime import date, datetime
+
+import pytest
+
+import config
+
+# The suite runs the real app on the SQLite backend in a scratch directory:
+# config is read when the modules are imported, so it is set up here,
+# before anything imports app. The upload folders are relative paths, hence
+# the chdir.
+_workdir = tempfile.mkdtemp(prefix='teachme-tests-')
+os.chdir(_workdir)
+config.DB_BACKEND = 'sqlite'
+config.SQLITE_PATH = os.path.join(_workdir, 'teachme.sqlite3')
+config.JOBS_DB = os.path.join(_workdir, 'jobs.sqlite3')
+config.SESSION_DB = os.path.join(_workdir, 'sessions.sqlite3')
+config.JOB_WORKERS = 0  # jobs are run by the tests that need them
+config.ARGON2_TIME_COST = 1
+config.ARGON2_MEMORY_COST = 8 * 1024
+
+from app import app as flask_app  # noqa: E402
+import db  # noqa: E402
+import passwords  # noqa: E402
+import users  # noqa: E402
+
+PASSWORD = 'test-password'
+_names = itertools.count()
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_workdir, ignore_errors=True)
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config['TESTING'] = True
+    return flask_app
+
+
+@pytest.fixture
+def conn(app):
+    with app.app_context():
+        yield db.get_connection()
+
+
+@pytest.fixture(scope='session')
+def password_hash():
+    return passwords.hash_password(PASSWORD)
+
+
+@pytest.fixture
+def make_user(app, password_hash):
+    # make_user(role) -> (id, username); every user gets PASSWORD
+    def make(role=3):
+        username = f"user{next(_names)}"
+        with app.app_context():
+            conn = db.get_connection()
+            cur = conn.cursor()
+            users.insert_user(cur, users.user_row(
+                {'name': 'Test', 'surname': username.title(), 'username': username,
+                 'email': f"{username}@example.com", 'birth_date': date(2000, 1, 1), 'sexe': 'Other'},
+                password_hash, role, datetime.now()))
+            user_id = cur.lastrowid
+            conn.commit()
+            cur.close()
+        return user_id, username
+    return make
+
+
+@pytest.fixture
+def login(app):
+    # login(username) -> a test client with that user's session
+    def log_in(username):
+        client = app.test_client()
+        rv = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert rv.status_code == 302 and rv.location.endswith('/dashboard')
+        return client
+    return log_in
+
+
+@pytest.fixture
+def make_quiz(app):
+    # make_quiz(n_questions) -> (quiz_id, [(question_id, [option ids], correct option id)])
+    def make(n_questions=3, n_options=3):
+        with app.app_context():
+            conn = db.get_connection()
+            cur = conn.cursor()
+            cur.execute("INSERT INTO quizzes (title, description) VALUES (%s, %s)", ('Quiz', 'test quiz'))
+            quiz_id = cur.lastrowid
+            questions = []
+            for i in range(n_questions):
+                cur.execute("INSERT INTO quiz_questions (quiz_id, question_text) VALUES (%s, %s)",
+                            (quiz_id, f"Question {i}?"))
+                question_id = cur.lastrowid
+                options = []
+                for j in range(n_options):
+                    cur.execute("INSERT INTO quiz_options (question_id, option_text, is_correct) VALUES (%s, %s, %s)",
+                                (question_id, f"Option {j}", j == 0))
+                    options.append(cur.lastrowid)
+                questions.append((question_id, options, options[0]))
+            conn.commit()
+            cur.close()
+        return quiz_id, questions
+    return make
@@ -0,0 +1,26 @@
+import bench
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert bench.percentile(values, 50) == 50
+    assert bench.percentile(values, 95) == 95
+    assert bench.percentile(values, 100) == 100
+    assert bench.percentile([7], 99) == 7
+    assert bench.percentile([], 50) == 0.0
+
+
+def test_compare_flags_slower_and_chattier_scenarios():
+    baseline = {
+        'login': {'p95_ms': 10.0, 'queries_per_request': 2.0},
+        'forums': {'p95_ms': 10.0, 'queries_per_request': 2.0},
+    }
+    results = {
+        'login': {'p95_ms': 12.0, 'queries_per_request': 2.0},
+        'forums': {'p95_ms': 13.0, 'queries_per_request': 3.0},
+        'dashboard': {'p95_ms': 99.0, 'queries_per_request': 9.0},  # not in the baseline
+    }
+    assert bench.compare(results, baseline, 0.25) == [
+        'forums: p95 10.0 -> 13.0 ms',
+        'forums: queries/request 2.0 -> 3.0',
+    ]
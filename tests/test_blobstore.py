@@ -0,0 +1,84 @@
+import hashlib
+import io
+import os
+
+from werkzeug.datastructures import FileStorage
+
+import blobstore
+
+
+def upload(data, filename='notes.txt'):
+    return FileStorage(io.BytesIO(data), filename=filename)
+
+
+def refcount(conn, sha256):
+    cur = conn.cursor()
+    cur.execute("SELECT refcount FROM blobs WHERE sha256 = %s", (sha256,))
+    row = cur.fetchone()
+    cur.close()
+    return row[0] if row else None
+
+
+def test_identical_content_is_stored_once(conn):
+    cur = conn.cursor()
+    first = blobstore.add_ref(cur, upload(b'same bytes'))
+    second = blobstore.add_ref(cur, upload(b'same bytes', 'copy.txt'))
+    conn.commit()
+    cur.close()
+    assert first == second
+    assert refcount(conn, first) == 2
+    with open(blobstore.blob_path(first), 'rb') as f:
+        assert f.read() == b'same bytes'
+
+
+def test_gc_keeps_referenced_and_recent_blobs(conn):
+    cur = conn.cursor()
+    kept = blobstore.add_ref(cur, upload(b'still used'))
+    released = blobstore.add_ref(cur, upload(b'released just now'))
+    blobstore.release(cur, released)
+    conn.commit()
+    cur.close()
+    blobstore.gc(conn)  # default grace period
+    assert os.path.exists(blobstore.blob_path(kept))
+    assert os.path.exists(blobstore.blob_path(released))
+
+
+def test_gc_removes_unreferenced_blob(conn):
+    cur = conn.cursor()
+    sha256 = blobstore.add_ref(cur, upload(b'short lived'))
+    blobstore.release(cur, sha256)
+    conn.commit()
+    cur.close()
+    assert refcount(conn, sha256) == 0
+    assert blobstore.gc(conn, grace=0) >= 1
+    assert not os.path.exists(blobstore.blob_path(sha256))
+    assert refcount(conn, sha256) is None
+
+
+def test_gc_removes_orphan_files(conn):
+    orphan = blobstore.blob_path('f' * 64)
+    os.makedirs(os.path.dirname(orphan), exist_ok=True)
+    with open(orphan, 'wb') as f:
+        f.write(b'left behind by a rolled back upload')
+    os.utime(orphan, (0, 0))
+    blobstore.gc(conn, grace=0)
+    assert not os.path.exists(orphan)
+
+
+def test_resubmission_releases_previous_file(conn, make_user, login):
+    cur = conn.cursor()
+    cur.execute("INSERT INTO assignments (title, description, due_date) VALUES (%s, %s, %s)",
+                ('Essay', '', '2099-01-01'))
+    assignment_id = cur.lastrowid
+    conn.commit()
+    _, student = make_user(3)
+    client = login(student)
+    for data in (b'draft', b'final'):
+        client.post(f'/assignments/{assignment_id}/submit', data={'file': (io.BytesIO(data), 'essay.txt')},
+                    content_type='multipart/form-data')
+    cur.execute("SELECT blob_sha256 FROM assignment_submissions WHERE assignment_id = %s", (assignment_id,))
+    rows = cur.fetchall()
+    cur.close()
+    assert len(rows) == 1
+    assert refcount(conn, rows[0][0]) == 1
+    assert refcount(conn, hashlib.sha256(b'draft').hexdigest()) == 0
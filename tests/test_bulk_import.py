@@ -0,0 +1,88 @@
+import io
+
+import pytest
+
+import bulk_import
+
+HEADER = 'name,surname,username,email,birth_date,sexe,password\n'
+
+
+def run_import(conn, text, fmt='csv'):
+    return bulk_import.import_students(conn, io.BytesIO(text.encode()), fmt, lambda pw: 'hashed:' + pw)
+
+
+def lines(errors):
+    return [(r['line'], r['error']) for r in errors]
+
+
+def test_csv_report(conn, make_user):
+    _, existing = make_user(3)
+    created, failed, errors = run_import(conn, HEADER + (
+        "Ada,Lovelace,ada_bulk,ada@example.com,1815-12-10,Female,pw1\n"
+        "Bad,Email,bad_bulk,nope,2000-01-01,Male,pw2\n"
+        f"Taken,Name,{existing},t@example.com,2000-01-01,Male,pw3\n"
+        "Ada,Again,ada_bulk,ada2@example.com,2000-01-01,Female,pw4\n"
+        "No,Date,nodate_bulk,n@example.com,01/02/2000,Other,pw5\n"
+    ))
+    assert (created, failed) == (1, 4)
+    assert lines(errors) == [
+        (3, 'invalid email'),
+        (4, 'username already exists'),
+        (5, 'duplicate username in file'),
+        (6, 'birth_date must be YYYY-MM-DD'),
+    ]
+    cur = conn.cursor()
+    cur.execute("SELECT Role, Password FROM Users WHERE Username = %s", ('ada_bulk',))
+    assert cur.fetchone() == (3, 'hashed:pw1')
+    cur.close()
+
+
+def test_csv_row_with_extra_columns(conn):
+    created, failed, errors = run_import(conn, HEADER + (
+        "Too,Many,extra_bulk,x@example.com,2000-01-01,Other,pw,surplus\n"
+        "Just,Right,right_bulk,r@example.com,2000-01-01,Other,pw\n"
+    ))
+    assert (created, failed) == (1, 1)
+    assert lines(errors) == [(2, 'too many columns')]
+
+
+def test_jsonl_report(conn):
+    created, failed, errors = run_import(conn, (
+        '{"name": "Grace", "surname": "Hopper", "username": "grace_bulk", "email": "g@example.com",'
+        ' "birth_date": "1906-12-09", "sexe": "Female", "password": "pw"}\n'
+        '\n'
+        'not json\n'
+        '["a list"]\n'
+        '{"name": "Only"}\n'
+    ), fmt='jsonl')
+    assert (created, failed) == (1, 3)
+    assert [r['line'] for r in errors] == [3, 4, 5]
+    assert errors[2]['error'].startswith('missing surname')
+
+
+@pytest.mark.parametrize('batch_size', [1, 2])
+def test_batches_of_any_size(conn, monkeypatch, batch_size):
+    monkeypatch.setattr(bulk_import.config, 'BULK_IMPORT_BATCH', batch_size)
+    rows = ''.join(f"N,S,batch{batch_size}_{i},b{i}@example.com,2000-01-01,Other,pw\n" for i in range(5))
+    assert run_import(conn, HEADER + rows) == (5, 0, [])
+
+
+def test_report_lists_first_errors_only(conn, monkeypatch):
+    monkeypatch.setattr(bulk_import.config, 'BULK_IMPORT_MAX_ERRORS', 3)
+    monkeypatch.setattr(bulk_import.config, 'BULK_IMPORT_BATCH', 4)
+    taken = "N,S,first_err_taken,t@example.com,2000-01-01,Other,pw\n"
+    run_import(conn, HEADER + taken)
+    # line 2 is only rejected when its batch is flushed, after the later bad emails
+    rows = taken + ''.join(f"N,S,first_err{i},bad-email,2000-01-01,Other,pw\n" for i in range(6))
+    created, failed, errors = run_import(conn, HEADER + rows)
+    assert (created, failed) == (0, 7)
+    assert lines(errors) == [(2, 'username already exists'), (3, 'invalid email'), (4, 'invalid email')]
+
+
+def test_bulk_route_json(make_user, login):
+    _, admin = make_user(1)
+    rv = login(admin).post('/add_student/bulk?format=json', content_type='multipart/form-data', data={
+        'file': (io.BytesIO((HEADER + "R,T,route_bulk,r@example.com,2000-01-01,Male,pw\n").encode()), 'students.csv')})
+    assert rv.status_code == 200
+    assert rv.get_json() == {'status': 'success', 'created': 1, 'failed': 0, 'errors': []}
+
@@ -0,0 +1,36 @@
+import db
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=()):
+        self.statements.append((sql, list(params)))
+
+
+def test_insert_many_batches_rows():
+    cur = RecordingCursor()
+    db.insert_many(cur, 'poll_options', ('poll_id', 'option_text'),
+                   ((1, f"option {i}") for i in range(5)), batch_size=2)
+    assert [sql.count('(%s, %s)') for sql, _ in cur.statements] == [2, 2, 1]
+    assert cur.statements[-1][1] == [1, 'option 4']
+
+
+def test_insert_many_without_rows():
+    cur = RecordingCursor()
+    db.insert_many(cur, 'poll_options', ('poll_id', 'option_text'), [])
+    assert cur.statements == []
+
+
+def test_create_poll_inserts_every_option(conn, make_user, login):
+    _, teacher = make_user(2)
+    rv = login(teacher).post('/polls/create', data={'question': 'Batched?', 'options': ['a', ' b ', 'c']})
+    assert rv.status_code == 302
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT o.option_text FROM poll_options o JOIN polls p ON o.poll_id = p.id
+        WHERE p.question = %s ORDER BY o.id
+    """, ('Batched?',))
+    assert [row[0] for row in cur.fetchall()] == ['a', 'b', 'c']
+    cur.close()
@@ -0,0 +1,166 @@
+import csv
+import io
+import os
+import zipfile
+
+import pyarrow.parquet as pq
+import pytest
+
+import config
+import exports
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # several batches even for a handful of rows
+    monkeypatch.setattr(config, 'EXPORT_BATCH_SIZE', 2)
+
+
+@pytest.fixture
+def quiz_with_attempts(make_quiz, make_user, login):
+    quiz_id, questions = make_quiz(2)
+    students = []
+    for _ in range(5):
+        _, student = make_user(3)
+        answers = {str(q_id): str(correct) for q_id, _, correct in questions}
+        login(student).post(f'/quizzes/{quiz_id}/submit', data=answers)
+        students.append(student)
+    return quiz_id, students
+
+
+def streamed(client, url):
+    # body chunks as the app produced them
+    rv = client.get(url, buffered=False)
+    chunks = list(rv.response)
+    rv.close()
+    return rv, chunks
+
+
+def test_csv_chunks_match_batches():
+    batches = [[(1, 'a'), (2, 'b')], [(3, 'c,d')]]
+    chunks = list(exports.csv_chunks(iter(batches), [('id', None), ('name', None)]))
+    assert len(chunks) == 2
+    assert list(csv.reader(io.StringIO(''.join(chunks)))) == [['id', 'name'], ['1', 'a'], ['2', 'b'], ['3', 'c,d']]
+
+
+def test_quiz_attempts_csv(small_batches, quiz_with_attempts, make_user, login):
+    quiz_id, students = quiz_with_attempts
+    _, teacher = make_user(2)
+    rv, chunks = streamed(login(teacher), f'/quizzes/{quiz_id}/results/export?format=csv')
+    assert rv.status_code == 200
+    assert rv.headers['Content-Disposition'] == f'attachment; filename=quiz_attempts_{quiz_id}.csv'
+    assert len(chunks) == 3  # 5 rows in batches of 2
+    rows = list(csv.DictReader(io.StringIO(b''.join(chunks).decode())))
+    assert [r['username'] for r in rows] == students
+    assert {r['score'] for r in rows} == {'2'}
+
+
+def test_quiz_answers_parquet(small_batches, quiz_with_attempts, make_user, login):
+    quiz_id, students = quiz_with_attempts
+    _, teacher = make_user(2)
+    rv, chunks = streamed(login(teacher), f'/quizzes/{quiz_id}/results/export?rows=answers&format=parquet')
+    assert rv.status_code == 200
+    parquet = pq.ParquetFile(io.BytesIO(b''.join(chunks)))
+    assert parquet.metadata.num_rows == 10
+    assert parquet.num_row_groups == 5
+    table = parquet.read()
+    assert set(table.column('correct').to_pylist()) == {1}
+    assert table.column('username').to_pylist()[::2] == students
+
+
+def test_export_errors(quiz_with_attempts, make_user, login):
+    quiz_id, students = quiz_with_attempts
+    _, teacher = make_user(2)
+    client = login(teacher)
+    assert client.get(f'/quizzes/{quiz_id}/results/export?format=xlsx').status_code == 400
+    assert client.get(f'/quizzes/{quiz_id}/results/export?rows=users').status_code == 400
+    assert client.get('/quizzes/999999/results/export').status_code == 404
+    assert login(students[0]).get(f'/quizzes/{quiz_id}/results/export').status_code == 403
+
+
+@pytest.fixture
+def assignment(conn):
+    # make_assignment(due_date) -> assignment id
+    def make(due_date):
+        cur = conn.cursor()
+        cur.execute("INSERT INTO assignments (title, description, due_date) VALUES (%s, %s, %s)",
+                    ('Homework', '', due_date))
+        assignment_id = cur.lastrowid
+        conn.commit()
+        cur.close()
+        return assignment_id
+    return make
+
+
+def submit(client, assignment_id, data, filename='work.txt'):
+    rv = client.post(f'/assignments/{assignment_id}/submit', data={'file': (io.BytesIO(data), filename)},
+                     content_type='multipart/form-data')
+    assert rv.status_code == 302
+
+
+def test_submissions_csv(assignment, make_user, login):
+    assignment_id = assignment('2099-01-01')
+    _, student = make_user(3)
+    submit(login(student), assignment_id, b'answer')
+    _, teacher = make_user(2)
+    rv = login(teacher).get(f'/assignments/{assignment_id}/submissions/export')
+    rows = list(csv.DictReader(io.StringIO(rv.data.decode())))
+    assert [r['username'] for r in rows] == [student]
+    assert rows[0]['file'].endswith('_work.txt')
+
+
+def test_submissions_zip(monkeypatch, conn, assignment, make_user, login):
+    monkeypatch.setattr(config, 'ARCHIVE_CHUNK_SIZE', 1024)
+    assignment_id = assignment('2099-01-01')
+    students = [make_user(3)[1] for _ in range(2)]
+    submit(login(students[0]), assignment_id, b'x' * 5000, 'scan.pdf')  # stored: written as read
+    submit(login(students[1]), assignment_id, b'second student')
+    # a second row for the first student, as left by older versions of the app
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO assignment_submissions (assignment_id, student_id, file, submitted_at)
+        SELECT assignment_id, student_id, 'lost.txt', '2001-01-01 00:00:00'
+        FROM assignment_submissions WHERE assignment_id = %s ORDER BY id LIMIT 1
+    """, (assignment_id,))
+    conn.commit()
+    cur.close()
+
+    _, teacher = make_user(2)
+    client = login(teacher)
+    rv, chunks = streamed(client, f'/assignments/{assignment_id}/submissions/download')
+    assert rv.status_code == 200 and rv.mimetype == 'application/zip'
+    assert len(chunks) > 5  # written out while the files are read
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+    assert archive.testzip() is None
+    names = archive.namelist()
+    assert sorted(n.split('/')[0] for n in names if '/' in n) == sorted(students)
+    assert archive.read('MISSING.txt').decode() == f"{students[0]}/lost.txt\n"
+    first = next(n for n in names if n.startswith(students[0] + '/'))
+    assert archive.read(first) == b'x' * 5000
+
+    rv, chunks = streamed(client, f'/assignments/{assignment_id}/submissions/download?latest=1')
+    latest = zipfile.ZipFile(io.BytesIO(b''.join(chunks))).namelist()
+    assert len(latest) == 2 and 'MISSING.txt' not in latest
+
+
+def test_closed_assignment_zip_is_cached(assignment, make_user, login):
+    assignment_id = assignment('2000-01-01')
+    _, student = make_user(3)
+    student_client = login(student)
+    submit(student_client, assignment_id, b'on time')
+    _, teacher = make_user(2)
+    client = login(teacher)
+    url = f'/assignments/{assignment_id}/submissions/download'
+
+    def cached():
+        return [n for n in os.listdir(config.ARCHIVE_FOLDER) if n.startswith(f'assignment_{assignment_id}_')]
+
+    first = client.get(url).data
+    assert len(cached()) == 1
+    rv = client.get(url)
+    assert rv.data == first and rv.headers.get('ETag')
+    assert client.get(url, headers={'If-None-Match': rv.headers['ETag']}).status_code == 304
+
+    submit(student_client, assignment_id, b'late')
+    client.get(url).data
+    assert len(cached()) == 1 and cached()[0] not in rv.headers['ETag']
@@ -0,0 +1,120 @@
+import threading
+from datetime import datetime
+
+import db
+import gradebook
+import jobs
+
+
+def quiz_row(conn, student_id):
+    cur = conn.cursor()
+    cur.execute("SELECT quiz_attempts, quizzes_taken, quiz_score, quiz_max FROM gradebook "
+                "WHERE student_id = %s AND course_id = 0", (student_id,))
+    row = cur.fetchone()
+    cur.close()
+    return tuple(row) if row else None
+
+
+def attempt(cur, student_id, quiz_id, score, max_score):
+    taken_at = datetime.now().replace(microsecond=0)
+    gradebook.record_attempt(cur, student_id, quiz_id, score, max_score, taken_at)
+    cur.execute("INSERT INTO quiz_attempts (quiz_id, user_id, score, taken_at) VALUES (%s, %s, %s, %s)",
+                (quiz_id, student_id, score, taken_at))
+
+
+def test_attempts_keep_best_score(conn, make_user, make_quiz):
+    student_id, _ = make_user(3)
+    first_quiz, _ = make_quiz(3)
+    second_quiz, _ = make_quiz(2)
+    cur = conn.cursor()
+    for quiz_id, score, max_score in [(first_quiz, 1, 3), (first_quiz, 3, 3), (first_quiz, 2, 3),
+                                      (second_quiz, 0, 2)]:
+        attempt(cur, student_id, quiz_id, score, max_score)
+        conn.commit()
+    cur.close()
+    assert quiz_row(conn, student_id) == (4, 2, 3, 5)
+
+    gradebook.rebuild(conn)
+    assert quiz_row(conn, student_id) == (4, 2, 3, 5)
+
+
+def test_concurrent_first_attempts(make_user, make_quiz):
+    # the second submit waits on the gradebook row and then sees the first attempt
+    student_id, _ = make_user(3)
+    quiz_id, _ = make_quiz(3)
+    barrier = threading.Barrier(2)
+
+    def submit(score):
+        raw = db.pool.get()
+        cur = raw.cursor()
+        barrier.wait()
+        try:
+            attempt(cur, student_id, quiz_id, score, 3)
+            raw.commit()
+        finally:
+            cur.close()
+            db.pool.put(raw)
+
+    threads = [threading.Thread(target=submit, args=(score,)) for score in (1, 2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    raw = db.pool.get()
+    try:
+        assert quiz_row(raw, student_id) == (2, 1, 2, 3)
+    finally:
+        db.pool.put(raw)
+
+
+def test_rebuild_route_queues_job(conn, make_user, login):
+    student_id, _ = make_user(3)
+    cur = conn.cursor()
+    cur.execute("DELETE FROM gradebook")
+    cur.execute("INSERT INTO quiz_attempts (quiz_id, user_id, score, taken_at) VALUES (%s, %s, %s, %s)",
+                (0, student_id, 1, datetime.now().replace(microsecond=0)))
+    conn.commit()
+    cur.close()
+
+    _, admin = make_user(1)
+    rv = login(admin).post('/admin/gradebook/rebuild')
+    assert rv.status_code == 202
+    assert jobs.run_one()
+    assert jobs.status(rv.get_json()['job_id'])['status'] == 'done'
+    assert quiz_row(conn, student_id) == (1, 1, 1, 0)
+
+
+def gradebook_rows(conn, student_ids):
+    cur = conn.cursor()
+    cur.execute(f"SELECT {', '.join(gradebook.COLUMNS)} FROM gradebook WHERE student_id IN "
+                f"({', '.join(['%s'] * len(student_ids))}) ORDER BY student_id, course_id", student_ids)
+    rows = [tuple(row) for row in cur.fetchall()]
+    cur.close()
+    return rows
+
+
+def test_rebuild_matches_incremental_updates(conn, make_user, login, make_quiz):
+    quiz_id, questions = make_quiz(3)
+    # a question nobody can get right: not part of the best possible score
+    cur = conn.cursor()
+    cur.execute("INSERT INTO quiz_questions (quiz_id, question_text) VALUES (%s, %s)", (quiz_id, 'Unkeyed?'))
+    cur.execute("INSERT INTO quiz_options (question_id, option_text, is_correct) VALUES (%s, %s, %s)",
+                (cur.lastrowid, 'maybe', False))
+    conn.commit()
+    cur.close()
+
+    student_ids = []
+    for right in (3, 1):
+        student_id, student = make_user(3)
+        student_ids.append(student_id)
+        client = login(student)
+        for r in (right, 0, right - 1):
+            answers = {str(q_id): str(correct if i < r else options[1])
+                       for i, (q_id, options, correct) in enumerate(questions)}
+            assert client.post(f'/quizzes/{quiz_id}/submit', data=answers).status_code == 302
+
+    incremental = gradebook_rows(conn, student_ids)
+    assert [row[2:6] for row in incremental] == [(3, 1, 3, 3), (3, 1, 1, 3)]
+    gradebook.rebuild(conn)
+    assert gradebook_rows(conn, student_ids) == incremental
@@ -0,0 +1,20 @@
+import pytest
+
+import config
+
+
+@pytest.mark.parametrize('token, public, headers, status', [
+    (None, False, {}, 403),
+    (None, True, {}, 200),
+    ('s3cret', False, {}, 403),
+    ('s3cret', False, {'Authorization': 'Bearer wrong'}, 403),
+    ('s3cret', False, {'Authorization': 'Bearer s3cret'}, 200),
+    ('s3cret', True, {}, 403),
+])
+def test_metrics_access(app, monkeypatch, token, public, headers, status):
+    monkeypatch.setattr(config, 'METRICS_TOKEN', token)
+    monkeypatch.setattr(config, 'METRICS_PUBLIC', public)
+    rv = app.test_client().get('/metrics', headers=headers)
+    assert rv.status_code == status
+    if status == 200:
+        assert b'db_queries_per_request' in rv.data
@@ -0,0 +1,32 @@
+import base64
+import json
+
+import pytest
+
+import pagination
+
+
+def token(raw):
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def test_cursor_round_trip():
+    cursor = pagination.encode_cursor('2024-01-02 03:04:05', 42)
+    assert pagination.decode_cursor(cursor, 2) == ['2024-01-02 03:04:05', 42]
+
+
+@pytest.mark.parametrize('cursor', [
+    None, '', 'not base64!', token('not json'), token('{"a": 1}'), token('[1]'),
+    token('[[1], {"a": 1}]'), token('["x", [2]]'),
+])
+def test_garbage_cursor_is_ignored(cursor):
+    assert pagination.decode_cursor(cursor, 2) is None
+
+
+def test_garbage_cursor_gives_first_page(make_user, login):
+    _, student = make_user(3)
+    client = login(student)
+    first = client.get('/forums/feed').get_json()
+    rv = client.get('/forums/feed', query_string={'cursor': token(json.dumps([[1], {'a': 1}]))})
+    assert rv.status_code == 200
+    assert rv.get_json() == first
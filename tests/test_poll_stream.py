@@ -0,0 +1,36 @@
+import logging
+
+import poll_stream
+
+
+def test_failing_ticks_are_logged_and_backed_off(monkeypatch, caplog):
+    monkeypatch.setattr(poll_stream.config, 'POLL_STREAM_MAX_BACKOFF', 5)
+    broadcaster = poll_stream.Broadcaster(1)
+    errors = [RuntimeError("pool exhausted")] * 4
+
+    def tick():
+        if errors:
+            raise errors.pop()
+
+    monkeypatch.setattr(broadcaster, 'tick', tick)
+    delays = [1]
+    with caplog.at_level(logging.ERROR, logger='poll_stream'):
+        for _ in range(5):
+            delays.append(broadcaster._safe_tick(delays[-1]))
+    assert delays == [1, 2, 4, 5, 5, 1]
+    assert len(caplog.records) == 4
+    assert 'pool exhausted' in caplog.text
+
+
+def test_publish_sends_snapshot_then_deltas():
+    broadcaster = poll_stream.Broadcaster(1)
+    q = broadcaster.subscribe(-1)
+    try:
+        broadcaster.publish(-1, {'options': {'1': 0, '2': 0}, 'total': 0})
+        broadcaster.publish(-1, {'options': {'1': 0, '2': 0}, 'total': 0})
+        broadcaster.publish(-1, {'options': {'1': 1, '2': 0}, 'total': 1})
+        events = [q.get_nowait() for _ in range(q.qsize())]
+    finally:
+        broadcaster.unsubscribe(-1, q)
+    assert [e.split('\n')[0] for e in events] == ['event: snapshot', 'event: delta']
+    assert '"options": {"1": 1}' in events[1]
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+import db
+import poll_tallies
+from app import fetch_polls_page
+
+
+@pytest.fixture
+def poll(app, make_user):
+    # (poll_id, [option ids])
+    creator, _ = make_user(2)
+    with app.app_context():
+        conn = db.get_connection()
+        cur = conn.cursor()
+        cur.execute("INSERT INTO polls (question, created_by) VALUES (%s, %s)", ('Which?', creator))
+        poll_id = cur.lastrowid
+        db.insert_many(cur, 'poll_options', ('poll_id', 'option_text'), [(poll_id, 'a'), (poll_id, 'b')])
+        cur.execute("SELECT id FROM poll_options WHERE poll_id = %s ORDER BY id", (poll_id,))
+        options = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+    return poll_id, options
+
+
+def vote_counts(conn, poll_id):
+    cur = conn.cursor()
+    cur.execute("SELECT vote_count FROM poll_options WHERE poll_id = %s ORDER BY id", (poll_id,))
+    counts = [row[0] for row in cur.fetchall()]
+    cur.close()
+    return counts
+
+
+def test_vote_is_counted_once(conn, poll, make_user, login):
+    poll_id, options = poll
+    _, student = make_user(3)
+    client = login(student)
+    assert client.post('/polls/vote', data={'poll_id': poll_id, 'option_id': options[1]}).status_code == 302
+    client.post('/polls/vote', data={'poll_id': poll_id, 'option_id': options[0]})
+    assert vote_counts(conn, poll_id) == [0, 1]
+
+
+def test_option_from_another_poll_is_rejected(conn, poll, make_user):
+    poll_id, options = poll
+    user_id, _ = make_user(3)
+    cur = conn.cursor()
+    assert not poll_tallies.record_vote(cur, poll_id + 1000, options[0], user_id)
+    conn.rollback()
+    cur.close()
+    assert vote_counts(conn, poll_id) == [0, 0]
+
+
+def test_concurrent_votes_by_one_user(poll, make_user):
+    # both pass the "already voted?" check; the unique index lets only one through
+    poll_id, options = poll
+    user_id, _ = make_user(3)
+    barrier = threading.Barrier(2)
+    outcomes = []
+
+    def vote(option_id):
+        raw = db.pool.get()
+        cur = raw.cursor()
+        barrier.wait()
+        try:
+            poll_tallies.record_vote(cur, poll_id, option_id, user_id)
+            raw.commit()
+            outcomes.append('voted')
+        except db.IntegrityError:
+            raw.rollback()
+            outcomes.append('duplicate')
+        finally:
+            cur.close()
+            db.pool.put(raw)
+
+    threads = [threading.Thread(target=vote, args=(option_id,)) for option_id in options]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert sorted(outcomes) == ['duplicate', 'voted']
+    raw = db.pool.get()
+    try:
+        assert sum(vote_counts(raw, poll_id)) == 1
+    finally:
+        db.pool.put(raw)
+
+
+def test_reconcile_repairs_counts(conn, poll, make_user):
+    poll_id, options = poll
+    user_id, _ = make_user(3)
+    cur = conn.cursor()
+    poll_tallies.record_vote(cur, poll_id, options[0], user_id)
+    cur.execute("UPDATE poll_options SET vote_count = 7 WHERE poll_id = %s", (poll_id,))
+    conn.commit()
+    cur.close()
+    poll_tallies.reconcile(conn, poll_id)
+    assert vote_counts(conn, poll_id) == [1, 0]
+
+
+def test_polls_feed_pages_and_vote_state(app, conn, poll, make_user):
+    poll_id, options = poll
+    user_id, _ = make_user(3)
+    cur = conn.cursor()
+    poll_tallies.record_vote(cur, poll_id, options[1], user_id)
+    cur.execute("SELECT COUNT(*) FROM polls")
+    total = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+
+    seen, cursor = {}, None
+    with app.test_request_context():
+        while True:
+            page, cursor = fetch_polls_page(user_id, cursor, limit=2)
+            assert len(page) <= 2
+            seen.update(page)
+            if cursor is None:
+                break
+    assert len(seen) == total
+    assert seen[poll_id]['voted_option_id'] == options[1]
+    assert [o['id'] for o in seen[poll_id]['options']] == options
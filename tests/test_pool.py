@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def pool():
+    return db.ConnectionPool(min_size=1, max_size=2, timeout=0.05, backend=db.backend)
+
+
+def test_fill_opens_min_size(pool):
+    pool.fill()
+    assert pool.stats()['size'] == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_connections_are_reused(pool):
+    first = pool.get()
+    pool.put(first)
+    assert pool.get() is first
+    assert pool.stats()['checkouts'] == 2
+
+
+def test_exhausted_after_timeout(pool):
+    held = [pool.get(), pool.get()]
+    with pytest.raises(db.PoolExhausted):
+        pool.get()
+    assert pool.stats()['exhausted_count'] == 1
+    for conn in held:
+        pool.put(conn)
+
+
+def test_waiter_gets_released_connection(pool):
+    pool.timeout = 5
+    held = [pool.get(), pool.get()]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.get()))
+    waiter.start()
+    pool.put(held[0])
+    waiter.join(5)
+    assert got == [held[0]]
+    assert pool.stats()['in_use'] == 2
+
+
+def test_put_rolls_back_open_transaction(pool):
+    conn = pool.get()
+    cur = conn.cursor()
+    cur.execute("INSERT INTO quizzes (title) VALUES (%s)", ('uncommitted',))
+    assert conn.in_transaction
+    pool.put(conn)
+    assert not conn.in_transaction
+    cur.execute("SELECT COUNT(*) FROM quizzes WHERE title = %s", ('uncommitted',))
+    assert cur.fetchone()[0] == 0
+
+
+def test_broken_connection_is_replaced(pool):
+    conn = pool.get()
+    pool.put(conn)
+    conn.close()  # fails the health check on the next checkout
+    replacement = pool.get()
+    assert replacement is not conn
+    assert pool.stats()['failed_health_checks'] == 1
+    assert pool.stats()['size'] == 1
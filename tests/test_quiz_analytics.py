@@ -0,0 +1,19 @@
+import quiz_analytics
+import quiz_store
+
+
+def test_submit_and_analytics(conn, make_user, login, make_quiz):
+    quiz_id, questions = make_quiz(2)
+    for right in (2, 1, 0):
+        _, student = make_user(3)
+        answers = {str(q_id): str(correct if i < right else options[1])
+                   for i, (q_id, options, correct) in enumerate(questions)}
+        assert login(student).post(f'/quizzes/{quiz_id}/submit', data=answers).status_code == 302
+
+    stats = quiz_analytics.get_analytics(conn, quiz_store.get_quiz(conn, quiz_id))
+    assert stats['attempts'] == 3
+    assert [b['count'] for b in stats['distribution']] == [1, 1, 1]
+    assert [item['difficulty'] for item in stats['items']] == [0.667, 0.333]
+    first = stats['items'][0]['options']
+    assert [o['count'] for o in first] == [2, 1, 0]
+    assert first[0]['is_correct']
@@ -0,0 +1,59 @@
+import quiz_store
+
+
+def test_quiz_is_cached(conn, make_quiz):
+    quiz_id, questions = make_quiz(3)
+    quiz = quiz_store.get_quiz(conn, quiz_id)
+    assert [q['id'] for q in quiz['questions']] == [q[0] for q in questions]
+    assert quiz['answer_key'] == {q_id: correct for q_id, _, correct in questions}
+    assert quiz_store.get_quiz(conn, quiz_id) is quiz
+
+
+def test_invalidate_reloads(conn, make_quiz):
+    quiz_id, _ = make_quiz(1)
+    quiz = quiz_store.get_quiz(conn, quiz_id)
+    quiz_store.invalidate(quiz_id)
+    assert quiz_store.get_quiz(conn, quiz_id) is not quiz
+
+
+def test_question_added_elsewhere_is_picked_up(conn, make_quiz, monkeypatch):
+    # another worker's add_question never calls this process's invalidate()
+    monkeypatch.setattr(quiz_store.config, 'QUIZ_CACHE_CHECK_INTERVAL', 60)
+    quiz_id, _ = make_quiz(2)
+    assert len(quiz_store.get_quiz(conn, quiz_id)['questions']) == 2
+    cur = conn.cursor()
+    cur.execute("INSERT INTO quiz_questions (quiz_id, question_text) VALUES (%s, %s)", (quiz_id, 'New?'))
+    conn.commit()
+    cur.close()
+    # not re-checked within the interval
+    assert len(quiz_store.get_quiz(conn, quiz_id)['questions']) == 2
+    monkeypatch.setattr(quiz_store.config, 'QUIZ_CACHE_CHECK_INTERVAL', 0)
+    assert len(quiz_store.get_quiz(conn, quiz_id)['questions']) == 3
+
+
+def test_versions_are_dropped_after_loads(conn, make_quiz):
+    quiz_id, _ = make_quiz(1)
+    quiz_store.get_quiz(conn, quiz_id)
+    for _ in range(3):
+        quiz_store.invalidate(quiz_id)
+        quiz_store.invalidate(999999)
+    quiz_store.get_quiz(conn, quiz_id)
+    assert quiz_store.cache._versions == {} and quiz_store.cache._loading == {}
+
+
+def test_missing_quiz(conn):
+    assert quiz_store.get_quiz(conn, 999999) is None
+
+
+def test_add_question_route(conn, make_user, login, make_quiz):
+    quiz_id, _ = make_quiz(1)
+    quiz_store.get_quiz(conn, quiz_id)
+    _, teacher = make_user(2)
+    client = login(teacher)
+    rv = client.post(f'/quizzes/{quiz_id}/add_question',
+                     data={'question_text': 'Added?', 'options[]': ['a', 'b'], 'correct_option': '1'})
+    assert rv.status_code == 302
+    quiz = quiz_store.get_quiz(conn, quiz_id)
+    assert [q['text'] for q in quiz['questions']][-1] == 'Added?'
+    assert quiz['answer_key'][quiz['questions'][-1]['id']] == quiz['questions'][-1]['options'][1]['id']
+
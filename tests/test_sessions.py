@@ -0,0 +1,78 @@
+import sessions
+
+
+def test_login_regenerates_session_id(app, make_user):
+    _, student = make_user(3)
+    client = app.test_client()
+    client.get('/login')
+    client.post('/login', data={'username': student, 'password': 'wrong'})
+    before = client.get_cookie('session')
+    client.post('/login', data={'username': student, 'password': 'test-password'})
+    after = client.get_cookie('session')
+    assert after is not None
+    assert before is None or before.value != after.value
+
+
+def test_session_id_is_stored_hashed(make_user, login):
+    _, student = make_user(3)
+    client = login(student)
+    sid = client.get_cookie('session').value
+    assert sessions.store.get(sid) is None
+    assert sessions.store.get(sessions._hash(sid)) is not None
+
+
+def test_revoke_logs_out_everywhere(make_user, login):
+    user_id, student = make_user(3)
+    clients = [login(student), login(student)]
+    for client in clients:
+        assert client.get('/dashboard').status_code == 200
+    assert sessions.revoke_user(user_id) == 2
+    for client in clients:
+        rv = client.get('/dashboard')
+        assert rv.status_code == 302 and '/login' in rv.location
+
+
+def test_deleted_user_is_logged_out(make_user, login):
+    user_id, student = make_user(3)
+    student_client = login(student)
+    _, admin = make_user(1)
+    rv = login(admin).post(f'/admin/delete/{user_id}')
+    assert rv.get_json() == {'status': 'success'}
+    rv = student_client.get('/dashboard')
+    assert rv.status_code == 302 and '/login' in rv.location
+
+
+def test_role_change_is_seen_from_the_db(conn, make_user, login):
+    user_id, username = make_user(3)
+    client = login(username)
+    assert client.get('/admin/dashboard').status_code == 403
+    cur = conn.cursor()
+    cur.execute("UPDATE Users SET Role = 1 WHERE ID = %s", (user_id,))
+    conn.commit()
+    cur.close()
+    sessions.user_changed(user_id)
+    assert client.get('/admin/dashboard').status_code == 200
+
+
+def test_logout_deletes_the_session(make_user, login):
+    _, student = make_user(3)
+    client = login(student)
+    sid = client.get_cookie('session').value
+    client.get('/logout')
+    assert sessions.store.get(sessions._hash(sid)) is None
+
+
+def test_pool_exhausted_while_loading_the_user_is_503(make_user, login, monkeypatch):
+    user_id, student = make_user(3)
+    client = login(student)
+    sessions.contexts.invalidate(user_id)
+
+    def exhausted(user_id):
+        raise sessions.db.PoolExhausted("no free DB connection")
+
+    monkeypatch.setattr(sessions.contexts, 'get', exhausted)
+    rv = client.get('/dashboard')
+    assert rv.status_code == 503 and rv.headers['Retry-After']
+    monkeypatch.undo()
+    # the stored session survived
+    assert client.get('/dashboard').status_code == 200
@@ -0,0 +1,27 @@
+import io
+
+import config
+
+HEADER = 'name,surname,username,email,birth_date,sexe,password\n'
+
+
+def post_bulk(client, query=''):
+    return client.post('/add_student/bulk' + query, content_type='multipart/form-data', data={
+        'file': (io.BytesIO(HEADER.encode()), 'students.csv')})
+
+
+def test_too_large_json_upload_is_413(make_user, login, monkeypatch):
+    monkeypatch.setitem(config.UPLOAD_SIZE_LIMITS, 'csv', 10)
+    _, admin = make_user(1)
+    rv = post_bulk(login(admin), '?format=json')
+    assert rv.status_code == 413
+    assert rv.get_json()['status'] == 'error'
+
+
+def test_too_large_upload_to_post_only_route_is_413(make_user, login, monkeypatch):
+    # no form to redirect back to
+    monkeypatch.setitem(config.UPLOAD_SIZE_LIMITS, 'csv', 10)
+    _, admin = make_user(1)
+    rv = post_bulk(login(admin))
+    assert rv.status_code == 413
+    assert rv.location is None
@@ -0,0 +1,53 @@
+import itertools
+from datetime import datetime
+
+import pytest
+
+import user_search
+import users
+
+_batches = itertools.count()
+
+
+@pytest.fixture
+def teachers(conn, password_hash):
+    # (surname, ids) of ten teachers, three without a registration date
+    surname = f"Joined{next(_batches):03d}x"
+    dates = [None, datetime(2024, 1, 1), None, datetime(2023, 5, 5), datetime(2024, 1, 1),
+             datetime(2022, 2, 2), None, datetime(2024, 1, 1), datetime(2021, 1, 1), datetime(2025, 1, 1)]
+    cur = conn.cursor()
+    ids = []
+    for i, registered in enumerate(dates):
+        username = f"{surname.lower()}{i}"
+        users.insert_user(cur, users.user_row(
+            {'name': 'Test', 'surname': surname, 'username': username, 'email': f"{username}@example.com",
+             'birth_date': '2000-01-01', 'sexe': 'Other'}, password_hash, 2, registered))
+        ids.append(cur.lastrowid)
+    conn.commit()
+    cur.close()
+    return surname, ids
+
+
+def all_pages(conn, surname, **kwargs):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = user_search.search_users(conn, 2, search=surname, cursor_token=cursor, limit=3, **kwargs)
+        seen += [row['ID'] for row in rows]
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize('sort', sorted(user_search.SORT_COLUMNS))
+@pytest.mark.parametrize('descending', [False, True])
+def test_paging_returns_every_user_once(conn, teachers, sort, descending):
+    surname, ids = teachers
+    seen = all_pages(conn, surname, sort=sort, descending=descending)
+    assert sorted(seen) == sorted(ids)
+
+
+def test_joined_order_with_null_dates(conn, teachers):
+    surname, ids = teachers
+    seen = all_pages(conn, surname, sort='joined')
+    # NULLs first, then by date, ties by ID
+    assert seen == [ids[i] for i in (0, 2, 6, 8, 5, 3, 1, 4, 7, 9)]
+    assert all_pages(conn, surname, sort='joined', descending=True) == seen[::-1]
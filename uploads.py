@@ -0,0 +1,130 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from flask import Request, g, has_request_context
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import config
+
+CHUNK_SIZE = 64 * 1024
+
+
+def format_size(n):
+    for unit in ('bytes', 'KB', 'MB'):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def size_limit(filename):
+    ext = filename.rsplit('.', 1)[1].lower() if filename and '.' in filename else ''
+    return config.UPLOAD_SIZE_LIMITS.get(ext, config.MAX_UPLOAD_SIZE)
+
+
+class UploadSpool:
+    # File object Werkzeug's multipart parser writes an uploaded file into.
+    # Bytes go straight to a temp file in the staging folder (same filesystem
+    # as the upload folders, so commit() is an atomic rename), the sha256 is
+    # updated as they arrive, and the per-type limit is enforced mid-upload.
+    def __init__(self, filename):
+        self.limit = size_limit(filename)
+        self.size = 0
+        self.hasher = hashlib.sha256()
+        fd, self.path = tempfile.mkstemp(prefix='upload-', dir=config.UPLOAD_STAGING_FOLDER)
+        self.file = os.fdopen(fd, 'w+b')
+        self.committed = False
+
+    @property
+    def sha256(self):
+        return self.hasher.hexdigest()
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.limit:
+            raise RequestEntityTooLarge(f"File is larger than the {format_size(self.limit)} allowed for this type.")
+        self.hasher.update(data)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def commit(self, dest):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.chmod(self.path, 0o644)
+        os.replace(self.path, dest)
+        self.committed = True
+
+    def discard(self):
+        if self.committed:
+            return
+        try:
+            self.file.close()
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        spool = UploadSpool(filename)
+        if has_request_context():
+            g.setdefault('upload_spools', []).append(spool)
+        return spool
+
+
+def spool(file):
+    """The UploadSpool holding an uploaded FileStorage's bytes.
+
+    Files parsed through UploadRequest already have one; anything else is
+    copied into a new spool in CHUNK_SIZE pieces. The spool is discarded at
+    the end of the request unless it gets committed.
+    """
+    stream = file.stream
+    if isinstance(stream, UploadSpool):
+        return stream
+
+    new = UploadSpool(file.filename)
+    if has_request_context():
+        g.setdefault('upload_spools', []).append(new)
+    try:
+        stream.seek(0)
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            new.write(chunk)
+    except BaseException:
+        new.discard()
+        raise
+    return new
+
+
+def discard_unsaved(exc=None):
+    # temp files of uploads the route didn't save (validation failed, error...)
+    for spool in g.pop('upload_spools', ()):
+        spool.discard()
+
+
+def clean_staging(max_age=3600):
+    # leftovers from a crash mid-upload
+    cutoff = time.time() - max_age
+    for name in os.listdir(config.UPLOAD_STAGING_FOLDER):
+        path = os.path.join(config.UPLOAD_STAGING_FOLDER, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def init_app(app):
+    os.makedirs(config.UPLOAD_STAGING_FOLDER, exist_ok=True)
+    app.request_class = UploadRequest
+    app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_SIZE
+    app.teardown_request(discard_unsaved)
+    clean_staging()
@@ -0,0 +1,66 @@
+import backends
+import db
+import pagination
+
+# sort option -> Users column; each has a (Role, column, ID) index in schema.INDEXES
+SORT_COLUMNS = {
+    'name': 'Name',
+    'surname': 'Surname',
+    'username': 'Username',
+    'email': 'Email',
+    'joined': 'Registration_date',
+    'id': 'ID',
+}
+SEARCH_COLUMNS = ('Name', 'Surname', 'Username', 'Email')
+# sort columns that can be NULL; both backends put NULLs first in ascending
+# order and last in descending order, and the keyset predicate follows that
+NULLABLE_COLUMNS = {'Registration_date'}
+
+
+def search_users(conn, role, search='', sort='name', descending=False, cursor_token=None, limit=50):
+    """One page of users with the given role, optionally filtered by a prefix
+    of Name, Surname, Username or Email.
+
+    Prefix matches ('abc%') can use the per-column indexes, unlike the old
+    '%abc%' scans. Pages are keyset-paginated on (sort column, ID).
+    Returns (rows, next_cursor).
+    """
+    column = SORT_COLUMNS.get(sort, 'Name')
+    op = '<' if descending else '>'
+    direction = 'DESC' if descending else 'ASC'
+
+    where = ["Role = %s"]
+    params = [role]
+
+    search = search.strip()
+    if search:
+        pattern = backends.escape_like(search) + '%'
+        where.append('(' + ' OR '.join(f"{c} LIKE %s{db.backend.like_escape}" for c in SEARCH_COLUMNS) + ')')
+        params += [pattern] * len(SEARCH_COLUMNS)
+
+    after = pagination.decode_cursor(cursor_token, 2)
+    if after:
+        if column == 'ID':
+            where.append(f"ID {op} %s")
+            params.append(after[1])
+        elif column in NULLABLE_COLUMNS and after[0] is None:
+            # still among the NULLs: the rest of them, then (ascending) every non-NULL row
+            rest = f" OR {column} IS NOT NULL" if not descending else ""
+            where.append(f"(({column} IS NULL AND ID {op} %s){rest})")
+            params.append(after[1])
+        else:
+            rest = f" OR {column} IS NULL" if column in NULLABLE_COLUMNS and descending else ""
+            where.append(f"({column} {op} %s OR ({column} = %s AND ID {op} %s){rest})")
+            params += [after[0], after[0], after[1]]
+
+    cur = conn.cursor(dictionary=True)
+    cur.execute(f"""
+        SELECT ID, Name, Surname, Username, Email, Registration_date
+        FROM Users
+        WHERE {' AND '.join(where)}
+        ORDER BY {column} {direction}, ID {direction}
+        LIMIT %s
+    """, params + [limit + 1])
+    rows = cur.fetchall()
+    cur.close()
+    return pagination.split_page(rows, limit, lambda r: (r[column], r['ID']))
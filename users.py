@@ -0,0 +1,18 @@
+# Users columns written when an account is created, shared by register,
+# add_student and the bulk import so they can't drift apart.
+
+FORM_FIELDS = ('name', 'surname', 'username', 'email', 'birth_date', 'sexe', 'password')
+COLUMNS = ('Name', 'Surname', 'Username', 'Email', 'Birth_date', 'Registration_date', 'Password', 'Role', 'Sexe')
+SEXES = ('Male', 'Female', 'Other')
+
+INSERT_SQL = f"INSERT INTO Users ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+
+
+def user_row(fields, hashed_pw, role, registration_date):
+    # fields: mapping with the FORM_FIELDS keys (request.form or an import row)
+    return (fields['name'], fields['surname'], fields['username'], fields['email'], fields['birth_date'],
+            registration_date, hashed_pw, role, fields['sexe'])
+
+
+def insert_user(cursor, row):
+    cursor.execute(INSERT_SQL, row)